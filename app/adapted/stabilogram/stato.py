@@ -30,7 +30,7 @@ class Stabilogram():
 
 
 
-    def from_array(self, array, center = True, original_frequency = None, time = None, resample = True, resample_frequency = 25, filter_ = True, filter_lower_bound=0, filter_upper_bound=10, filter_order = 4 ):
+    def from_array(self, array, center = True, original_frequency = None, time = None, resample = True, resample_frequency = 25, filter_ = True, filter_lower_bound=0, filter_upper_bound=10, filter_order = 4, dtype = None ):
         """
         Import an array as a stabilogram.
 
@@ -43,9 +43,12 @@ class Stabilogram():
         resample : resample the signal to the values defined in the paper. See the function resample for more details
         filter_ : resample the signal to the values defined in the paper. See the function filter_ for more details
 
+        dtype : floating type of the stored signal (e.g. np.float32 to halve the memory traffic). None keeps the type of array.
+
         """
 
-        signal = np.array(array)
+        # d = 2 never writes into the array, so it is only copied when the type changes
+        signal = np.asarray(array, dtype=dtype)
 
         self.raw_signal = signal
 
@@ -64,7 +67,7 @@ class Stabilogram():
             if original_frequency is not None:
 
                 time = np.arange(len(signal))/original_frequency
-                time = time[:,None]
+                time = time[:,None].astype(np.result_type(signal.dtype, np.float32))
 
             valid_index = (np.sum(np.isnan(signal),axis=1) == 0)
             time = time[valid_index]
@@ -80,6 +83,8 @@ class Stabilogram():
             signal = np.concatenate([time, signal], axis = 1)
 
         else :
+            signal = signal.copy()
+            self.raw_signal = signal
             # time start from 0
             time = signal[:,0]
             time = time - time[0]
@@ -135,7 +140,7 @@ class Stabilogram():
             b, a = butter(order, (low,high), btype='bandpass')
 
         y = filtfilt(b, a, signal,axis=0)
-        self.signal = y
+        self.signal = y.astype(signal.dtype, copy=False)
 
 
 
@@ -0,0 +1,16 @@
+import sys
+
+from utils.wbb_binary import convert_tree
+
+
+def log_callback(message, color="black"):
+    print(message, file=sys.stderr if color == "red" else sys.stdout)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python convert_wbb.py <input_dir> <output_dir>")
+        sys.exit(1)
+    converted, failed = convert_tree(sys.argv[1], sys.argv[2], log_callback)
+    print(f"{len(converted)} recordings converted, {len(failed)} failed")
+    sys.exit(1 if failed else 0)
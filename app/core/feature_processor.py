@@ -0,0 +1,31 @@
+from adapted.descriptors import compute_all_features
+from adapted.stabilogram.stato import Stabilogram
+
+# Radius of the sway density, in cm (3 mm)
+SWAY_DENSITY_RADIUS = 0.3
+
+
+class FeatureProcessor:
+    def __init__(self, config):
+        self.config = config
+
+    def compute_features(self, x_y):
+        """
+        Posturography features of a resampled recording
+
+        Args:
+            x_y: Array of shape (n, 2) of the mediolateral and anteroposterior
+                positions, sampled at the configured desired_frequency
+
+        Returns:
+            Dict feature name -> value, in the order of csv_file_header
+        """
+        stato = Stabilogram()
+        stato.from_array(array=x_y, original_frequency=self.config.get("desired_frequency"), resample=False,
+                         dtype=self.config.dtype)
+        return compute_all_features(stato, params_dic={"sway_density_radius": SWAY_DENSITY_RADIUS})
+
+    @staticmethod
+    def feature_row(file, features):
+        """Row of the summary CSV: the file name and its features"""
+        return ",".join([file] + [f"{value}" for value in features.values()])
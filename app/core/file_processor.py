@@ -1,23 +1,357 @@
+import io
+import json
 import os
+import tarfile
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from queue import Full, Queue
+from threading import Event
+from time import perf_counter
+
 import numpy as np
-from utils.wbb_file_parser import parse_wbb_file
+from utils import cutting, dataset_store, delta_codec, output_formats, resampling, wbb_binary, wbb_file_parser
+from utils.archives import archive_kind, archive_members, iter_tar
+from utils.cutting import cut_recording
+from utils.dataset_store import STORE_NAME, DatasetStore, encode_chunk
+from utils.manifest import scan_recording, write_manifest, read_manifest
+from utils.output_formats import (OUTPUT_FORMATS, get_output_format, output_columns, write_output,
+                                  write_text_blocks)
+from utils.output_reader import load_output
+from utils.qa import QAReport, check_recording, write_qa_report
+from utils.resampling import PreparedRecording
+from utils.run_manifest import RunManifest, source_version
+from utils.wbb_file_parser import (parse_wbb_file, parse_wbb_bytes, iter_wbb_file, ParseStats,
+                                   DEFAULT_CHANNELS)
+
+# Run manifest of process_files, in the output folder
+RUN_MANIFEST_NAME = "_run_manifest.json"
+# Seconds between two saves of the run manifest during process_files
+CHECKPOINT_SECONDS = 5
+# Fraction of the dataset store taken by stale chunks and extra indexes from which process_files compacts it
+STORE_COMPACT_FRACTION = 0.25
+# Decompressed members of a tarball held ahead of their processing
+TAR_PREFETCH = 16
+# Version of the code shaping the outputs, recorded in the run manifest: the modules parsing, resampling, cutting,
+# encoding and writing them. This module only wires them together: the channel order and output rates it sets are
+# recorded as run parameters and the output names as manifest keys, so its own source is left out (a change of a
+# log message does not recompute every output). Code changing the content of an output belongs in those modules.
+CODE_VERSION = source_version(*(module.__file__ for module in (wbb_file_parser, wbb_binary, resampling, cutting,
+                                                               output_formats, delta_codec, dataset_store)))
 
 
 class FileProcessor:
-    def __init__(self, resampling_method):
+    def __init__(self, resampling_method, channels=DEFAULT_CHANNELS, output_frequencies=(), parse_cache=None,
+                 streaming_threshold=None, decompress_workers=1, qa=None, processes=1, output_format="txt",
+                 quantization_step=1e-4, output_store=False):
         self.resampling_method = resampling_method
+        # File format of the outputs, see utils.output_formats
+        self.output_format = get_output_format(output_format)
+        # Quantization step of the wbbq output format, 0 for lossless
+        self.quantization_step = quantization_step
+        # Whether process_files appends its outputs to the DatasetStore of the output folder instead of
+        # writing one file per output, and the chunks encoded for it, not appended yet
+        self.output_store = output_store
+        self.store = None
+        self.store_chunks = []
+        # Processes handling files in parallel in process_files (1: in the calling thread)
+        self.processes = max(1, processes)
+        # Keyword arguments of utils.qa.check_recording, None to skip the QA checks
+        self.qa = qa
+        self.qa_reports = []
+        # Threads decompressing the members of compressed inputs ahead of their processing
+        self.decompress_workers = max(1, decompress_workers)
+        # Raw files from this size on (bytes) are parsed, resampled and written block by block
+        self.streaming_threshold = streaming_threshold
+        # Optional ParseCache of the parsed raw files
+        self.parse_cache = parse_cache
+        # Extra output rates, written under _rates/<frequency>Hz next to the main output
+        self.output_frequencies = [f for f in output_frequencies if f != resampling_method.desired_frequency]
+        # X and Y always come first so the image and feature stages can read the first three columns
+        self.channels = list(DEFAULT_CHANNELS) + [c for c in channels if c not in DEFAULT_CHANNELS]
         self.errors = []
+        self.path_counts = {}
+        # RunManifest of the output folder of the current process_files run
+        self.run_manifest = None
+        self.last_checkpoint = 0.
+        # Stage run on every output of process_files, and what it returned for each output
+        self.on_output = None
+        self.output_results = []
+
+    def process_files(self, input_dir, output_dir, cut_option, x, y, max_depth=1, log_callback=None, manifest=None,
+                      on_output=None):
+        """
+        Process files from input directory and save to output directory
+
+        With a manifest (path of a file written by scan_inputs) only its "ok" recordings are processed.
+        Outputs already computed from the same input content, parameters and code (see RunManifest)
+        are kept, the others are computed again.
 
-    def process_files(self, input_dir, output_dir, cut_option, x, y, max_depth=1, log_callback=None):
-        """Process files from input directory and save to output directory"""
+        on_output(output_path, time, signal, log_callback), e.g. core.output_stages.OutputStages, is
+        called on every output from the arrays just written (kept outputs and streamed files are read
+        back). What it returns is collected in output_results, in file order.
+        """
         self.errors = []  # Reset errors list
-        base_depth = input_dir.rstrip(os.sep).count(os.sep)
+        self.path_counts = {}
+        self.qa_reports = []
+        self.on_output = on_output
+        self.output_results = []
+        self.store_chunks = []
+        if self.output_store:
+            os.makedirs(output_dir, exist_ok=True)
+            self.store = DatasetStore(os.path.join(output_dir, STORE_NAME))
+        self.run_manifest = RunManifest(os.path.join(output_dir, RUN_MANIFEST_NAME),
+                                        self._run_parameters(cut_option, x, y), CODE_VERSION)
+        self.last_checkpoint = perf_counter()
+        plan = None
+
+        if log_callback:
+            log_callback(f"Cutting method chosen: {cut_option}", color="blue")
+            log_callback(f"X seconds: {x}, Y seconds: {y}", color="blue")
+            log_callback(f"Resampling backend: {getattr(self.resampling_method, 'backend_name', 'custom')}",
+                         color="blue")
+            log_callback(f"Output format: {self.output_format}", color="blue")
+        if manifest is not None:
+            plan = {row["file"]: row for row in read_manifest(manifest)}
+            ok = [row for row in plan.values() if row["status"] == "ok"]
+            if log_callback:
+                log_callback(f"Manifest {manifest}: {len(ok)}/{len(plan)} recordings to process, "
+                             f"{sum(row['duration'] for row in ok):.1f} s and "
+                             f"~{sum(row['estimated_samples'] for row in ok)} samples in total", color="blue")
+        if log_callback:
+            log_callback("Starting processing:")
+
+        entries = self._planned(self._entries(input_dir, max_depth, log_callback), input_dir, plan, log_callback)
+        try:
+            if self.processes > 1:
+                self._process_parallel(entries, input_dir, output_dir, cut_option, x, y, log_callback)
+            else:
+                for root, file, read in entries:
+                    self._process_file(root, file, input_dir, output_dir, cut_option, x, y, log_callback, read)
+                    self._append_chunks()
+                    self._checkpoint()
+        finally:
+            if self.output_store:
+                self._append_chunks()
+            self._checkpoint(force=True)
+
+        if self.output_store and self.store.compact(STORE_COMPACT_FRACTION) and log_callback:
+            log_callback(f"Dataset store compacted: {os.path.getsize(self.store.path)} bytes", color="blue")
+        self._save_error_log()
+        if self.qa_reports:
+            os.makedirs(os.path.join(output_dir, "_qa"), exist_ok=True)
+            report_path = os.path.join(output_dir, "_qa", "qa_report.csv")
+            write_qa_report(report_path, self.qa_reports)
+            if log_callback:
+                counts = {status: sum(report.status == status for report in self.qa_reports)
+                          for status in ("ok", "warn", "reject", "skipped (streamed)")}
+                log_callback(f"QA: {counts['ok']} ok, {counts['warn']} warn, {counts['reject']} reject, "
+                             f"{counts['skipped (streamed)']} skipped (streamed), report saved to {report_path}",
+                             color="blue")
+        if log_callback:
+            if self.path_counts:
+                total = sum(self.path_counts.values())
+                hits = ", ".join(f"{path} {count}/{total}" for path, count in sorted(self.path_counts.items()))
+                log_callback(f"Resampling paths: {hits} files", color="blue")
+            if self.parse_cache is not None:
+                log_callback(f"Parse cache: {self.parse_cache.hits} hits, {self.parse_cache.misses} misses",
+                             color="blue")
+            log_callback("Processing completed!")
+
+    def process_sweep(self, input_dir, output_dir, cut_option, x, y, parameters, max_depth=1, log_callback=None):
+        """
+        Resample every file under each (window_size, desired_frequency) pair of parameters.
+
+        Each file is parsed once. With the numpy backend the running sums are shared by all pairs
+        and the output grid by all pairs with the same frequency; other backends resample every
+        pair on their own. Results go to one
+        w<window_size>_f<desired_frequency> subfolder per pair of the _sweep folder of output_dir,
+        which the image and feature stages skip, and one row per file and pair is added to
+        _sweep/sweep_summary.csv.
+        """
+        self.errors = []  # Reset errors list
+        self.path_counts = {}
+        parameters = [(float(window_size), float(desired_frequency)) for window_size, desired_frequency in parameters]
+        methods = [self.resampling_method.with_parameters(window_size, desired_frequency)
+                   for window_size, desired_frequency in parameters]
 
         if log_callback:
             log_callback(f"Cutting method chosen: {cut_option}", color="blue")
             log_callback(f"X seconds: {x}, Y seconds: {y}", color="blue")
+            log_callback(f"Resampling backend: {getattr(self.resampling_method, 'backend_name', 'custom')}",
+                         color="blue")
+            log_callback(f"Sweeping {len(parameters)} parameter pairs (window size, frequency): {parameters}",
+                         color="blue")
             log_callback("Starting processing:")
 
+        sweep_dir = os.path.join(output_dir, "_sweep")
+        os.makedirs(sweep_dir, exist_ok=True)
+        summary_path = os.path.join(sweep_dir, "sweep_summary.csv")
+        with open(summary_path, 'w') as summary:
+            summary.write("file,window_size,desired_frequency,samples,empty_windows,skipped_time\n")
+
+            for root, file, read in self._entries(input_dir, max_depth, log_callback):
+                file_path, log_path, output_subdir, output_path = self._output_location(root, file, input_dir,
+                                                                                        output_dir)
+                if log_callback:
+                    log_callback(f"Working on {log_path}")
+                try:
+                    stats = ParseStats()
+                    time, signal = self._parse(file_path, stats, read)
+                    if log_callback:
+                        log_callback(f"Parsed {stats.samples} samples ({stats.method}), "
+                                     f"max delta: {stats.max_delta:.3f} s", color="blue")
+                    shared = getattr(self.resampling_method, 'backend_name', None) == "numpy"
+                    prepared = PreparedRecording(time, signal) if shared else None
+
+                    for (window_size, desired_frequency), method in zip(parameters, methods):
+                        combination = f"w{window_size:g}_f{desired_frequency:g}"
+                        start = perf_counter()
+                        if shared:
+                            resampled_time, resampled_signal, empty_windows, skipped_time = \
+                                method.resample_prepared(prepared)
+                        else:
+                            resampled_time, resampled_signal, empty_windows, skipped_time = \
+                                method.resample(time, signal)
+                        timing = perf_counter() - start
+                        path = getattr(method, 'last_path', None)
+                        if path is not None:
+                            self.path_counts[path] = self.path_counts.get(path, 0) + 1
+                        if log_callback:
+                            log_callback(f"{combination}: resampled with "
+                                         f"{getattr(method, 'backend_name', 'custom')} backend ({path} path) "
+                                         f"in {timing:.3f} s", color="blue")
+                        resampled_time, resampled_signal = self._cut(resampled_time, resampled_signal, cut_option,
+                                                                     x, y, None)
+
+                        combination_path = os.path.join(sweep_dir, combination,
+                                                        os.path.relpath(output_path, output_dir))
+                        os.makedirs(os.path.dirname(combination_path), exist_ok=True)
+                        self._write_output(combination_path, resampled_time, resampled_signal)
+                        summary.write(f"{os.path.relpath(file_path, input_dir)},{window_size:g},{desired_frequency:g},"
+                                      f"{len(resampled_time)},{empty_windows},{skipped_time}\n")
+                        if log_callback:
+                            color = "red" if empty_windows > 0 else "green"
+                            log_callback(f"{combination}: {len(resampled_time)} samples, "
+                                         f"{empty_windows} empty windows", color=color)
+
+                except Exception as e:
+                    if log_callback:
+                        log_callback(f"Error processing file: {file_path}", color="red")
+                        log_callback(f"Exception: {e}", color="red")
+                    self.errors.append(file_path)
+
+        self._save_error_log()
+        if log_callback:
+            if self.path_counts:
+                hits = ", ".join(f"{path} {count}" for path, count in sorted(self.path_counts.items()))
+                log_callback(f"Resampling paths: {hits} resamplings", color="blue")
+            log_callback(f"Sweep summary saved to {summary_path}", color="green")
+            log_callback("Processing completed!")
+
+    def _planned(self, entries, input_dir, plan, log_callback):
+        """Filter (root, file, read) entries down to the "ok" recordings of a manifest plan, if any"""
+        for root, file, read in entries:
+            if plan is not None:
+                row = plan.get(os.path.relpath(os.path.join(root, file), input_dir))
+                if row is None or row["status"] != "ok":
+                    if log_callback:
+                        status = "not in the manifest" if row is None else row["status"]
+                        log_callback(f"Skipping {os.path.join(root, file)}, {status}.", color="red")
+                    continue
+            yield root, file, read
+
+    def _process_parallel(self, entries, input_dir, output_dir, cut_option, x, y, log_callback):
+        """
+        Run _process_file on a pool of self.processes processes. The log messages of every file are
+        replayed in file order once it is done, and the errors, paths, QA reports, cache counts, run
+        manifest records and on_output results of the workers are merged into this processor. Store
+        chunks are encoded by the workers and appended by this process only.
+        """
+        pending = deque()
+
+        def collect(limit):
+            while len(pending) > limit:
+                file_path, future = pending.popleft()
+                try:
+                    logs, errors, path_counts, qa_reports, cache_counts, records, results, chunks = \
+                        future.result()
+                except Exception as e:
+                    logs, errors, path_counts, qa_reports, cache_counts, records, results, chunks = \
+                        [(f"Error processing file: {file_path}", "red"), (f"Exception: {e}", "red")], \
+                        [file_path], {}, [], (0, 0), {}, [], []
+                if log_callback:
+                    for message, color in logs:
+                        log_callback(message, color=color)
+                self.errors.extend(errors)
+                for path, count in path_counts.items():
+                    self.path_counts[path] = self.path_counts.get(path, 0) + count
+                self.qa_reports.extend(qa_reports)
+                self.run_manifest.merge(records)
+                self.output_results.extend(results)
+                self.store_chunks.extend(chunks)
+                self._append_chunks()
+                if self.parse_cache is not None:
+                    self.parse_cache.hits += cache_counts[0]
+                    self.parse_cache.misses += cache_counts[1]
+                self._checkpoint()
+
+        with ProcessPoolExecutor(self.processes, initializer=_init_worker, initargs=(self,)) as pool:
+            for root, file, read in entries:
+                file_path = os.path.join(root, file)
+                try:
+                    # Archive members travel to the worker as bytes
+                    data = read() if read is not None else None
+                    future = pool.submit(_process_in_worker, root, file, input_dir, output_dir, cut_option, x, y,
+                                         data)
+                except Exception as e:
+                    future = Future()
+                    future.set_exception(e)
+                pending.append((file_path, future))
+                collect(2 * self.processes)
+            collect(0)
+
+    def scan_inputs(self, input_dir, manifest_path, max_depth=1, log_callback=None):
+        """
+        Write a manifest (CSV, or JSON for a .json path) of the recordings of input_dir: size, first and
+        last time stamps, duration, estimated sample count and rate, and whether the file is truncated.
+        Only the first and last lines of every file are read.
+        """
+        self.errors = []  # Reset errors list
+        rows = []
+        for root, file, read in self._entries(input_dir, max_depth, None):
+            file_path = os.path.join(root, file)
+            try:
+                if read is None:
+                    with open(file_path, 'rb') as f:
+                        row = scan_recording(f, os.fstat(f.fileno()).st_size)
+                else:
+                    data = read()
+                    row = scan_recording(io.BytesIO(data), len(data))
+            except Exception as e:
+                if log_callback:
+                    log_callback(f"Error scanning file: {file_path}", color="red")
+                    log_callback(f"Exception: {e}", color="red")
+                self.errors.append(file_path)
+                continue
+            row["file"] = os.path.relpath(file_path, input_dir)
+            rows.append(row)
+            if log_callback and row["status"] != "ok":
+                log_callback(f"{row['file']}: {row['status']}", color="red")
+
+        os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+        write_manifest(manifest_path, rows)
+        self._save_error_log()
+        if log_callback:
+            ok = sum(row["status"] == "ok" for row in rows)
+            log_callback(f"Scanned {len(rows)} recordings ({ok} ok), "
+                         f"{sum(row['duration'] for row in rows):.1f} s in total", color="blue")
+            log_callback(f"Manifest saved to {manifest_path}", color="green")
+        return rows
+
+    def _walk(self, input_dir, max_depth, log_callback):
+        """Yield (root, file) for every file of input_dir down to max_depth"""
+        base_depth = input_dir.rstrip(os.sep).count(os.sep)
         for root, _, files in os.walk(input_dir):
             base_folder = os.path.basename(input_dir.rstrip(os.sep))
             relative_path = os.path.relpath(root, input_dir)
@@ -34,80 +368,187 @@ class FileProcessor:
                 continue
 
             for file in files:
-                self._process_file(root, file, input_dir, output_dir, cut_option, x, y, log_callback)
+                yield root, file
 
-        self._save_error_log()
-        if log_callback:
-            log_callback("Processing completed!")
+    def _entries(self, input_dir, max_depth, log_callback):
+        """
+        Yield (root, file, read) for every recording of input_dir down to max_depth.
 
-    def _process_file(self, root, file, input_dir, output_dir, cut_option, x, y, log_callback):
-        file_path = os.path.join(root, file)
+        Compressed inputs (see utils.archives) are replaced by their members, root and file
+        being where the member would be extracted, and read returning its decompressed bytes.
+        Members are decompressed ahead on decompress_workers threads; a tarball is read in a single
+        pass, so each one goes to a thread as a whole and its members are yielded as they come out.
+        read is None for plain files.
+        """
+        base_depth = input_dir.rstrip(os.sep).count(os.sep)
+        pending = deque()
+        # Tells the threads still reading a tarball that its members are not wanted anymore
+        stop = Event()
 
-        # Create output path
+        def member_entry(root, member, read):
+            member_root, member_file = os.path.split(os.path.join(root, member))
+            if member_root.count(os.sep) - base_depth <= max_depth:
+                return member_root, member_file, read
+            return None
+
+        def archive_error(file_path, e):
+            if log_callback:
+                log_callback(f"Error reading archive: {file_path}", color="red")
+                log_callback(f"Exception: {e}", color="red")
+            self.errors.append(file_path)
+
+        def ready(limit):
+            while len(pending) > limit:
+                entry = pending.popleft()
+                if not isinstance(entry[2], Queue):
+                    yield entry
+                    continue
+                root, file, members = entry
+                while True:
+                    item = members.get()
+                    if item is None:
+                        break
+                    if isinstance(item, Exception):
+                        archive_error(os.path.join(root, file), item)
+                        break
+                    member, data = item
+                    entry = member_entry(root, member, lambda data=data: data)
+                    if entry is not None:
+                        yield entry
+
+        with ThreadPoolExecutor(self.decompress_workers) as pool:
+            try:
+                for root, file in self._walk(input_dir, max_depth, log_callback):
+                    kind = archive_kind(file)
+                    if kind is None:
+                        pending.append((root, file, None))
+                    elif kind == "tar":
+                        members = Queue(TAR_PREFETCH)
+                        pool.submit(_decompress_tar, os.path.join(root, file), members, stop)
+                        pending.append((root, file, members))
+                    else:
+                        try:
+                            for member, read in archive_members(os.path.join(root, file)):
+                                entry = member_entry(root, member, pool.submit(read).result)
+                                if entry is not None:
+                                    pending.append(entry)
+                                    yield from ready(self.decompress_workers)
+                        except (OSError, EOFError, zipfile.BadZipFile) as e:
+                            archive_error(os.path.join(root, file), e)
+                        continue
+                    yield from ready(self.decompress_workers)
+                yield from ready(0)
+            finally:
+                stop.set()
+
+    def _parse(self, file_path, stats, read=None, file_hash=None):
+        """
+        Parse a raw file, or the bytes returned by read for an archive member. file_hash, the content hash
+        of a raw file when already known, saves the parse cache from hashing it again.
+        """
+        dtype = getattr(self.resampling_method, 'dtype', np.float64)
+        if read is not None:
+            return parse_wbb_bytes(read(), dtype=dtype, channels=self.channels, stats=stats)
+        return parse_wbb_file(file_path, dtype=dtype, channels=self.channels, stats=stats, cache=self.parse_cache,
+                              file_hash=file_hash)
+
+    def _output_location(self, root, file, input_dir, output_dir):
+        """Return (file_path, log_path, output_subdir, output_path) of an input file"""
+        file_path = os.path.join(root, file)
         base_folder = os.path.basename(input_dir.rstrip(os.sep))
         relative_path = os.path.relpath(file_path, input_dir)
         log_path = f"{base_folder}/{relative_path}"
         if relative_path == ".":
             log_path = f"{base_folder}"
         output_subdir = os.path.join(output_dir, os.path.dirname(relative_path).replace(os.sep, '-'))
-        output_filename = relative_path.replace(os.sep, '-') + ".csv"
+        output_filename = relative_path.replace(os.sep, '-') + OUTPUT_FORMATS[self.output_format]
         output_path = os.path.join(output_subdir, output_filename)
+        return file_path, log_path, output_subdir, output_path
 
-        # Skip if already processed
-        if os.path.exists(output_path):
-            if log_callback:
-                log_callback(f"Skipping {log_path}, already processed.")
-            return
+    def _process_file(self, root, file, input_dir, output_dir, cut_option, x, y, log_callback, read=None):
+        # Create output path
+        file_path, log_path, output_subdir, output_path = self._output_location(root, file, input_dir, output_dir)
 
-        if log_callback:
-            log_callback(f"Working on {log_path}")
+        output_key = os.path.relpath(output_path, output_dir)
 
         try:
-            # Ensure output directory exists
-            os.makedirs(output_subdir, exist_ok=True)
-
-            # Process the file
-            time, signal = parse_wbb_file(file_path)
-            resampled_time, resampled_signal, empty_windows, skipped_time = self.resampling_method.resample(time,
-                                                                                                            signal)
+            # Skip if already processed from the same input, parameters and code
+            exists = (self._store_name(output_path, output_dir) in self.store if self.output_store
+                      else os.path.exists(output_path))
+            fingerprint = self.run_manifest.fingerprint(output_key, file_path, read)
+            reason = self.run_manifest.stale(output_key, exists, fingerprint)
+            if reason is None:
+                if log_callback:
+                    log_callback(f"Skipping {log_path}, already processed.")
+                self._run_on_output(output_path, output_dir, None, None, log_callback)
+                return
 
-            # Apply cutting logic
             if log_callback:
-                log_callback(f"Cutting method: {cut_option}", color="blue")
-                log_callback(f"Original time range: {resampled_time[0]:.2f} to {resampled_time[-1]:.2f}", color="blue")
-            if cut_option == 1:
-                # Cut first X seconds and last Y seconds
-                mask = (resampled_time >= x + resampled_time[0]) & (resampled_time <= (resampled_time[-1] - y))
-                resampled_time = resampled_time[mask]
-                resampled_signal = resampled_signal[mask]
-                if log_callback:
-                    log_callback(f"Cutting first {x:.2f} seconds and last {y:.2f} seconds", color="blue")
-            elif cut_option == 2:
-                # Cut first X seconds and take Y seconds after
-                mask = (resampled_time >= x + resampled_time[0]) & (resampled_time <= (x + resampled_time[0] + y))
-                resampled_time = resampled_time[mask]
-                resampled_signal = resampled_signal[mask]
-                if log_callback:
-                    log_callback(f"Cutting first {x:.2f} seconds and taking {y:.2f} seconds after", color="blue")
+                log_callback(f"Working on {log_path}")
+                if exists:
+                    log_callback(f"Reprocessing, {reason}", color="blue")
+
+            if read is None and self._streams(file_path, cut_option):
+                try:
+                    self._stream_file(file_path, log_path, output_path, log_callback)
+                    self.run_manifest.record(output_key, file_path, fingerprint)
+                    self._run_on_output(output_path, output_dir, None, None, log_callback)
+                    return
+                except ValueError as e:
+                    # e.g. time stamps going backwards, which only the whole-file path handles
+                    if log_callback:
+                        log_callback(f"Streaming failed ({e}), reading the whole file", color="red")
+
+            # Process the file
+            stats = ParseStats(count_widths=self.qa is not None)
+            time, signal = self._parse(file_path, stats, read, fingerprint["hash"])
             if log_callback:
-                log_callback(f"New time range: {resampled_time[0]:.2f} to {resampled_time[-1]:.2f}", color="blue")
+                log_callback(f"Parsed {stats.samples} samples ({stats.method}), max delta: {stats.max_delta:.3f} s",
+                             color="blue")
+            if self.qa is not None and not self._passes_qa(log_path, time, signal, stats, log_callback):
+                self.errors.append(file_path)
+                return
+            if self.output_frequencies:
+                rates = self.resampling_method.resample_rates(
+                    time, signal, [self.resampling_method.desired_frequency] + self.output_frequencies)
+                resampled_time, resampled_signal, empty_windows, skipped_time = \
+                    rates.pop(self.resampling_method.desired_frequency)
+            else:
+                rates = {}
+                resampled_time, resampled_signal, empty_windows, skipped_time = self.resampling_method.resample(
+                    time, signal)
+            timing = getattr(self.resampling_method, 'last_timing', None)
+            path = getattr(self.resampling_method, 'last_path', None)
+            if path is not None:
+                self.path_counts[path] = self.path_counts.get(path, 0) + 1
+            if log_callback and timing is not None:
+                log_callback(f"Resampled with {self.resampling_method.backend_name} backend ({path} path) "
+                             f"in {timing:.3f} s", color="blue")
 
-            resampled_combined = np.column_stack((resampled_time, resampled_signal))
+            resampled_time, resampled_signal = self._cut(resampled_time, resampled_signal, cut_option, x, y,
+                                                         log_callback)
+            saved_to = self._save_output(output_path, output_dir, resampled_time, resampled_signal,
+                                         self.resampling_method.desired_frequency)
 
-            # Save the result
-            with open(output_path, 'w') as f:
-                f.write("Time(s) X(cm) Y(cm)\n")
-                np.savetxt(f, resampled_combined, fmt="%.9f", delimiter=" ")
+            for frequency, (rate_time, rate_signal, _, _) in rates.items():
+                rate_time, rate_signal = self._cut(rate_time, rate_signal, cut_option, x, y, None)
+                rate_path = os.path.join(output_dir, "_rates", f"{frequency:g}Hz",
+                                         os.path.relpath(output_path, output_dir))
+                rate_saved_to = self._save_output(rate_path, output_dir, rate_time, rate_signal, frequency)
+                if log_callback:
+                    log_callback(f"Saved {frequency:g} Hz output to {rate_saved_to}", color="green")
+            self.run_manifest.record(output_key, file_path, fingerprint)
 
             if log_callback:
                 if empty_windows > 0 or skipped_time > 0.:
                     log_callback(f"Processed {log_path}", color="red")
                     log_callback(f"Empty windows: {empty_windows}", color="red")
                     log_callback(f"Skipped time due to lack of data: {skipped_time}", color="red")
-                    log_callback(f"Saved to {output_path}", color="green")
+                    log_callback(f"Saved to {saved_to}", color="green")
                 else:
                     log_callback(f"Processed {log_path}")
-                    log_callback(f"Saved to {output_path}", color="green")
+                    log_callback(f"Saved to {saved_to}", color="green")
+            self._run_on_output(output_path, output_dir, resampled_time, resampled_signal, log_callback)
 
         except Exception as e:
             if log_callback:
@@ -115,6 +556,149 @@ class FileProcessor:
                 log_callback(f"Exception: {e}", color="red")
             self.errors.append(file_path)
 
+    def _run_on_output(self, output_path, output_dir, time, signal, log_callback):
+        """
+        Run on_output on an output, reading the output back when its arrays are not in memory.
+        Outputs of the store are passed as <output_dir>/<store name>.
+        """
+        if self.on_output is None:
+            return
+        if self.output_store:
+            name = self._store_name(output_path, output_dir)
+            output_path = os.path.join(output_dir, name)
+            data = self.store.read(name) if time is None else None
+        else:
+            data = load_output(output_path) if time is None else None
+        if data is not None:
+            time, signal = data[:, 0], data[:, 1:]
+        self.output_results.append(self.on_output(output_path, time, signal, log_callback))
+
+    @staticmethod
+    def _store_name(output_path, output_dir):
+        """Name in the store of an output: its path relative to the output folder, without extension"""
+        return os.path.splitext(os.path.relpath(output_path, output_dir))[0].replace(os.sep, "/")
+
+    def _save_output(self, output_path, output_dir, resampled_time, resampled_signal, frequency):
+        """
+        Write an output file, or encode it for the store (see _append_chunks)
+
+        Returns:
+            Where the output is saved, for the log
+        """
+        if not self.output_store:
+            # Ensure output directory exists
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            self._write_output(output_path, resampled_time, resampled_signal)
+            return output_path
+        name = self._store_name(output_path, output_dir)
+        columns = output_columns(self.channels)
+        chunk, chunk_format = encode_chunk(np.column_stack((resampled_time, resampled_signal)), columns,
+                                           self.output_format, self.quantization_step)
+        self.store_chunks.append((name, chunk, chunk_format, len(resampled_time), columns, frequency))
+        return f"{self.store.path}:{name}"
+
+    def _append_chunks(self):
+        """Append the encoded store chunks to the store"""
+        for chunk in self.store_chunks:
+            self.store.append(*chunk)
+        self.store_chunks = []
+
+    def _checkpoint(self, force=False):
+        """
+        Index the appended store chunks and save the run manifest if records were added, at most every
+        CHECKPOINT_SECONDS unless forced, so a run killed midway keeps the outputs and records of the files
+        already done. The store is flushed first so the manifest never records an unindexed output.
+        """
+        if not force and perf_counter() - self.last_checkpoint < CHECKPOINT_SECONDS:
+            return
+        if self.output_store:
+            self.store.flush()
+        if self.run_manifest.changed:
+            self.run_manifest.save()
+        self.last_checkpoint = perf_counter()
+
+    def _run_parameters(self, cut_option, x, y):
+        """
+        Parameters shaping the outputs of process_files, as recorded in the run manifest. Settings that only
+        choose how the same output is computed (uniform_tolerance, workers, chunk_ticks, processes, ...) are
+        left out, so changing them recomputes nothing. The backend stays: engines agree to about 1e-9 only.
+        """
+        method = self.resampling_method
+        parameters = {"method": type(method).__name__, "channels": self.channels,
+                      "output_frequencies": self.output_frequencies, "cut_option": cut_option,
+                      "x": x if cut_option else None, "y": y if cut_option else None,
+                      "output_format": self.output_format,
+                      "quantization_step": self.quantization_step if self.output_format == "wbbq" else None}
+        for name in ("window_size", "desired_frequency", "backend_name"):
+            parameters[name] = getattr(method, name, None)
+        parameters["dtype"] = np.dtype(getattr(method, 'dtype', np.float64)).str
+        # Through JSON, as read back from a saved manifest
+        return json.loads(json.dumps(parameters))
+
+    def _passes_qa(self, log_path, time, signal, stats, log_callback):
+        """Run the QA checks of a parsed recording and record their report. False if it is rejected."""
+        # Values per line were counted by the parser, from the text it decoded
+        report = check_recording(time, signal, self.resampling_method.window_size, stats.widths, **self.qa)
+        report.file = log_path
+        self.qa_reports.append(report)
+
+        if log_callback and report.status != "ok":
+            color = "red" if report.status == "reject" else "orange"
+            log_callback(f"QA {report.status}: {'; '.join(report.issues)}", color=color)
+        return report.status != "reject"
+
+    def _streams(self, file_path, cut_option):
+        """Whether a file goes through the bounded-memory pipeline of _stream_file"""
+        return (self.streaming_threshold is not None and cut_option == 0 and not self.output_frequencies
+                and self.output_format == "txt" and not self.output_store
+                and self.parse_cache is None and hasattr(self.resampling_method, 'stream')
+                and os.path.getsize(file_path) >= self.streaming_threshold)
+
+    def _stream_file(self, file_path, log_path, output_path, log_callback):
+        """Parse, resample and write a raw file block by block, without cutting"""
+        # Ensure output directory exists
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        stats = ParseStats()
+        stream = self.resampling_method.stream()
+        blocks = iter_wbb_file(file_path, dtype=getattr(self.resampling_method, 'dtype', np.float64),
+                               channels=self.channels, stats=stats)
+        write_text_blocks(output_path, output_columns(self.channels), stream.feed(blocks))
+
+        if self.qa is not None:
+            # The checks need the whole recording: list the file without them
+            report = QAReport(log_path)
+            report.status = "skipped (streamed)"
+            report.samples = stats.samples
+            self.qa_reports.append(report)
+        if log_callback:
+            log_callback(f"Streamed {stats.samples} samples, max delta: {stats.max_delta:.3f} s", color="blue")
+            color = "red" if stream.empty_windows > 0 else "black"
+            log_callback(f"Processed {log_path}", color=color)
+            if stream.empty_windows > 0:
+                log_callback(f"Empty windows: {stream.empty_windows}", color="red")
+                log_callback(f"Skipped time due to lack of data: {stream.skipped_time}", color="red")
+            log_callback(f"Saved to {output_path}", color="green")
+
+    def _cut(self, resampled_time, resampled_signal, cut_option, x, y, log_callback):
+        """Apply the cutting option to a resampled signal"""
+        if log_callback:
+            log_callback(f"Cutting method: {cut_option}", color="blue")
+            log_callback(f"Original time range: {resampled_time[0]:.2f} to {resampled_time[-1]:.2f}", color="blue")
+        resampled_time, resampled_signal = cut_recording(resampled_time, resampled_signal, cut_option, x, y)
+        if log_callback:
+            if cut_option == 1:
+                log_callback(f"Cutting first {x:.2f} seconds and last {y:.2f} seconds", color="blue")
+            elif cut_option == 2:
+                log_callback(f"Cutting first {x:.2f} seconds and taking {y:.2f} seconds after", color="blue")
+            log_callback(f"New time range: {resampled_time[0]:.2f} to {resampled_time[-1]:.2f}", color="blue")
+        return resampled_time, resampled_signal
+
+    def _write_output(self, output_path, resampled_time, resampled_signal):
+        """Save a resampled signal in the output format"""
+        resampled_combined = np.column_stack((resampled_time, resampled_signal))
+        write_output(output_path, resampled_combined, output_columns(self.channels), self.output_format,
+                     self.quantization_step)
+
     def _save_error_log(self):
         """Save error log if there were errors"""
         if self.errors:
@@ -122,3 +706,59 @@ class FileProcessor:
                 error_file.write("Files that encountered errors:\n")
                 for error in self.errors:
                     error_file.write(f"{error}\n")
+
+
+def _decompress_tar(file_address, members, stop):
+    """
+    Put the (member, data) of a tarball on the members queue in archive order, then None, or the exception
+    that stopped the reading. Gives up once stop is set.
+    """
+    def put(item):
+        while not stop.is_set():
+            try:
+                members.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    try:
+        for item in iter_tar(file_address):
+            if not put(item):
+                return
+        put(None)
+    except (OSError, EOFError, tarfile.TarError) as e:
+        put(e)
+
+
+# FileProcessor copy of every process of the process_files pool
+_worker_processor = None
+
+
+def _init_worker(processor):
+    global _worker_processor
+    _worker_processor = processor
+
+
+def _process_in_worker(root, file, input_dir, output_dir, cut_option, x, y, data):
+    """
+    Process one file in a pool process
+
+    Returns:
+        Tuple of (log messages as (message, color) pairs, errors, path counts, QA reports,
+        (parse cache hits, misses), run manifest records, on_output results, store chunks) of this file
+    """
+    processor = _worker_processor
+    processor.errors, processor.path_counts, processor.qa_reports, processor.output_results = [], {}, [], []
+    processor.store_chunks = []
+    processor.run_manifest.updated = {}
+    cache = processor.parse_cache
+    cache_counts = (cache.hits, cache.misses) if cache is not None else (0, 0)
+    logs = []
+    processor._process_file(root, file, input_dir, output_dir, cut_option, x, y,
+                            lambda message, color="black": logs.append((message, color)),
+                            None if data is None else lambda: data)
+    if cache is not None:
+        cache_counts = (cache.hits - cache_counts[0], cache.misses - cache_counts[1])
+    return logs, processor.errors, processor.path_counts, processor.qa_reports, cache_counts, \
+        processor.run_manifest.updated, processor.output_results, processor.store_chunks
@@ -1,44 +1,53 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import numpy as np
+import os
+
+from matplotlib.figure import Figure
+from matplotlib.gridspec import GridSpec
+
+from utils.output_formats import output_stem
 
 
 class ImageProcessor:
     def __init__(self, config):
         self.config = config
 
-    def generate_image(self, file_path, output_path):
+    @staticmethod
+    def image_path(images_dir, file_path):
+        """Path of the image of an output file, or of a recording of the store"""
+        return os.path.join(images_dir, output_stem(os.path.basename(file_path)) + ".jpg")
+
+    def render_image(self, time, x, y, output_path):
         """
-        Generate an image with 3 subplots from CSV data
+        Generate an image with 3 subplots from the time, mediolateral and
+        anteroposterior arrays of a recording
         1. Anteroposterior(cm) x Mediolateral(cm) 2D view
         2. Mediolateral(cm) vs Time(s)
         3. Anteroposterior(cm) vs Time(s)
+
+        The figure is drawn without pyplot, so images can be rendered from
+        any thread or process.
         """
         try:
-            # Read data from CSV file
-            df = pd.read_csv(file_path, sep=r'\s+', skiprows=1,
-                             names=['Time', 'X', 'Y'])
-
             # Normalize time to start from 0 & Center the data
-            df['Time'] = df['Time'] - df['Time'].min()
-            df['X'] = df['X'] - df['X'].mean()
-            df['Y'] = df['Y'] - df['Y'].mean()
+            time = time - time.min()
+            x = x - x.mean()
+            y = y - y.mean()
 
             # Create figure with subplots
-            fig = plt.figure(figsize=(self.config.get('figure_width', 10),
-                                      self.config.get('figure_height', 8)))
+            fig = Figure(figsize=(self.config.get('figure_width', 10),
+                                  self.config.get('figure_height', 8)))
+            grid = GridSpec(2, 5, figure=fig)
 
             # 1. Anteroposterior(cm) x Mediolateral(cm) 2D view on the left
-            ax1 = plt.subplot2grid((2, 5), (0, 0), rowspan=2, colspan=2)
+            ax1 = fig.add_subplot(grid[0:2, 0:2])
             ax1.set_box_aspect(1)
-            ax1.plot(df['X'], df['Y'],
+            ax1.plot(x, y,
                      self.config.get('plot_line_style', '-'),
                      color=self.config.get('trajectory_color', 'navy'),
                      linewidth=self.config.get('plot_line_width', 1.5))
 
             # Make the plot square with equal limits
-            x_lim = max(df['X'].max(), abs(df['X'].min()))
-            y_lim = max(df['Y'].max(), abs(df['Y'].min()))
+            x_lim = max(x.max(), abs(x.min()))
+            y_lim = max(y.max(), abs(y.min()))
             x_lim = max(x_lim, 1) + 0.5
             y_lim = max(y_lim, 1) + 0.5
             ax1.set_xlim(-x_lim, x_lim)
@@ -50,10 +59,10 @@ class ImageProcessor:
             ax1.grid(False)
 
             # 2. Mediolateral(cm) vs Time(s) on the right top
-            ax2 = plt.subplot2grid((2, 5), (0, 2), colspan=3)
+            ax2 = fig.add_subplot(grid[0, 2:5])
             ax2.set_box_aspect(0.4)
 
-            ax2.plot(df['Time'], df['X'],
+            ax2.plot(time, x,
                      self.config.get('plot_line_style', '-'),
                      color=self.config.get('mediolateral_color', 'navy'),
                      linewidth=self.config.get('plot_line_width', 1.5))
@@ -65,10 +74,10 @@ class ImageProcessor:
             ax2.grid(False)
 
             # 3. Anteroposterior(cm) vs Time(s) on the right bottom
-            ax3 = plt.subplot2grid((2, 5), (1, 2), colspan=3)
+            ax3 = fig.add_subplot(grid[1, 2:5])
             ax3.set_box_aspect(0.4)
 
-            ax3.plot(df['Time'], df['Y'],
+            ax3.plot(time, y,
                      self.config.get('plot_line_style', '-'),
                      color=self.config.get('anteroposterior_color', 'navy'),
                      linewidth=self.config.get('plot_line_width', 1.5))
@@ -81,10 +90,9 @@ class ImageProcessor:
             ax3.grid(False)
 
             # Adjust layout
-            plt.tight_layout()
+            fig.tight_layout()
 
-            plt.savefig(output_path, dpi=self.config.get('dpi', 300))
-            plt.close(fig)
+            fig.savefig(output_path, dpi=self.config.get('dpi', 300))
 
             return output_path
         except Exception as e:
@@ -0,0 +1,50 @@
+import os
+
+
+class OutputStages:
+    """
+    Image and feature stages of the fused pipeline, run by
+    FileProcessor.process_files on every output while its arrays are still in
+    memory, instead of walking the output folder and reading the files again.
+    Picklable, so it also runs in the processes of a parallel run.
+    """
+
+    def __init__(self, image_processor, feature_processor, images_dir):
+        self.image_processor = image_processor
+        self.feature_processor = feature_processor
+        self.images_dir = images_dir
+
+    def __call__(self, output_path, time, signal, log_callback=None):
+        """
+        Render the image and compute the features of an output
+
+        Args:
+            output_path: Path of the output file
+            time, signal: Content of the output, signal columns starting with X and Y
+
+        Returns:
+            Row of the summary CSV, None when the features failed
+        """
+        file = os.path.basename(output_path)
+        image_path = self.image_processor.image_path(self.images_dir, output_path)
+        if os.path.exists(image_path) and os.path.exists(output_path) \
+                and os.path.getmtime(image_path) >= os.path.getmtime(output_path):
+            if log_callback:
+                log_callback(f"Image of {file} is up to date", color="blue")
+        else:
+            result = self.image_processor.render_image(time, signal[:, 0], signal[:, 1], image_path)
+            if log_callback:
+                if result == image_path:
+                    log_callback(f"Image saved to {image_path}", color="green")
+                else:
+                    log_callback(f"Error generating image for {output_path}: {result}", color="red")
+
+        try:
+            features = self.feature_processor.compute_features(signal[:, :2])
+        except Exception as e:
+            if log_callback:
+                log_callback(f"Error processing file {file}: {e}", color="red")
+            return None
+        if log_callback:
+            log_callback(f"Features added for {file}", color="green")
+        return self.feature_processor.feature_row(file, features)
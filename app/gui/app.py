@@ -11,13 +11,27 @@ from core.image_processor import ImageProcessor
 from workers.file_worker import FileProcessorWorker
 from workers.image_worker import ImageProcessorWorker
 from utils.config import Config
+from utils.parse_cache import ParseCache
 
 
 class ProcessorApp(QWidget):
     def __init__(self, resampling_method):
         super().__init__()
         self.config = Config()
-        self.file_processor = FileProcessor(resampling_method)
+        parse_cache = None
+        if self.config.parse_cache_dir:
+            parse_cache = ParseCache(os.path.expanduser(self.config.parse_cache_dir),
+                                     self.config.parse_cache_max_mb * 2 ** 20)
+        self.file_processor = FileProcessor(resampling_method, channels=self.config.channels,
+                                            output_frequencies=self.config.output_frequencies,
+                                            parse_cache=parse_cache,
+                                            streaming_threshold=self.config.streaming_threshold_mb * 2 ** 20,
+                                            decompress_workers=self.config.decompress_workers,
+                                            qa=self.config.qa,
+                                            processes=self.config.processes,
+                                            output_format=self.config.output_format,
+                                            quantization_step=self.config.quantization_step,
+                                            output_store=self.config.output_store)
         self.image_processor = ImageProcessor(self.config)
         self.input_dir = ""
         self.output_dir = ""
@@ -120,10 +134,34 @@ class ProcessorApp(QWidget):
         )
         self.csv_button.clicked.connect(self.generate_csv)
 
+        self.sweep_button = QPushButton("Parameter Sweep")
+        self.sweep_button.setStyleSheet(
+            f"font-size: {self.config.get('process_button_font_size')}px; "
+            f"padding: {self.config.get('process_button_padding')}px;"
+        )
+        self.sweep_button.clicked.connect(self.process_sweep)
+
+        self.fused_button = QPushButton("Process + Images + CSV")
+        self.fused_button.setStyleSheet(
+            f"font-size: {self.config.get('process_button_font_size')}px; "
+            f"padding: {self.config.get('process_button_padding')}px;"
+        )
+        self.fused_button.clicked.connect(self.process_fused)
+
+        self.scan_button = QPushButton("Scan Inputs")
+        self.scan_button.setStyleSheet(
+            f"font-size: {self.config.get('process_button_font_size')}px; "
+            f"padding: {self.config.get('process_button_padding')}px;"
+        )
+        self.scan_button.clicked.connect(self.scan_inputs)
+
         cut_layout = QHBoxLayout()
+        cut_layout.addWidget(self.scan_button)
         cut_layout.addWidget(self.process_button)
         cut_layout.addWidget(self.image_button)
         cut_layout.addWidget(self.csv_button)
+        cut_layout.addWidget(self.fused_button)
+        cut_layout.addWidget(self.sweep_button)
         layout.addLayout(cut_layout)
 
     def _create_status_and_log(self, layout):
@@ -187,6 +225,98 @@ class ProcessorApp(QWidget):
 
         self.file_thread.finished.connect(lambda: self.status_label.setText("Processing completed!"))
 
+    def process_fused(self):
+        """Start file processing, generating the images and the summary CSV file in the same pass"""
+        if not self.input_dir:
+            self.status_label.setText("Please select an input folder.")
+            return
+
+        if not self.output_dir:
+            self.status_label.setText("Please select an output folder.")
+            return
+
+        self.update_log("Starting file processing with images and CSV...")
+
+        # Create a QThread object
+        self.fused_thread = QThread()
+        # Create a worker object
+        self.fused_worker = FileProcessorWorker(self.file_processor, self.input_dir, self.output_dir, self.config,
+                                                self.cut_option,
+                                                self.x_input.text(), self.y_input.text())
+        # Move the worker to the thread
+        self.fused_worker.moveToThread(self.fused_thread)
+        # Connect signals and slots
+        self.fused_thread.started.connect(self.fused_worker.process_fused)
+        self.fused_worker.log_signal.connect(self.update_log)
+        self.fused_worker.finished_signal.connect(self.fused_thread.quit)
+        self.fused_worker.finished_signal.connect(self.fused_worker.deleteLater)
+        self.fused_thread.finished.connect(self.fused_thread.deleteLater)
+        # Start the thread
+        self.fused_thread.start()
+
+        self.fused_thread.finished.connect(lambda: self.status_label.setText("Processing completed!"))
+
+    def scan_inputs(self):
+        """Write a manifest of the input folder to the output folder"""
+        if not self.input_dir:
+            self.status_label.setText("Please select an input folder.")
+            return
+
+        if not self.output_dir:
+            self.status_label.setText("Please select an output folder.")
+            return
+
+        self.update_log("Starting input scan...")
+
+        # Create a QThread object
+        self.scan_thread = QThread()
+        # Create a worker object
+        self.scan_worker = FileProcessorWorker(self.file_processor, self.input_dir, self.output_dir, self.config,
+                                               None, None, None)
+        # Move the worker to the thread
+        self.scan_worker.moveToThread(self.scan_thread)
+        # Connect signals and slots
+        self.scan_thread.started.connect(self.scan_worker.scan)
+        self.scan_worker.log_signal.connect(self.update_log)
+        self.scan_worker.finished_signal.connect(self.scan_thread.quit)
+        self.scan_worker.finished_signal.connect(self.scan_worker.deleteLater)
+        self.scan_thread.finished.connect(self.scan_thread.deleteLater)
+        # Start the thread
+        self.scan_thread.start()
+
+        self.scan_thread.finished.connect(lambda: self.status_label.setText("Input scan completed!"))
+
+    def process_sweep(self):
+        """Start a parameter sweep over the input folder"""
+        if not self.input_dir:
+            self.status_label.setText("Please select an input folder.")
+            return
+
+        if not self.output_dir:
+            self.status_label.setText("Please select an output folder.")
+            return
+
+        self.update_log("Starting parameter sweep...")
+
+        # Create a QThread object
+        self.sweep_thread = QThread()
+        # Create a worker object
+        self.sweep_worker = FileProcessorWorker(self.file_processor, self.input_dir, self.output_dir, self.config,
+                                                self.cut_option,
+                                                self.x_input.text(), self.y_input.text())
+        # Move the worker to the thread
+        self.sweep_worker.moveToThread(self.sweep_thread)
+        # Connect signals and slots
+        self.sweep_thread.started.connect(self.sweep_worker.process_sweep)
+        self.sweep_worker.log_signal.connect(self.update_log)
+        self.sweep_worker.finished_signal.connect(self.sweep_thread.quit)
+        self.sweep_worker.finished_signal.connect(self.sweep_worker.deleteLater)
+        self.sweep_thread.finished.connect(self.sweep_thread.deleteLater)
+        # Start the thread
+        self.sweep_thread.start()
+
+        self.sweep_thread.finished.connect(lambda: self.status_label.setText("Parameter sweep completed!"))
+
     def generate_images(self):
         """Generate images from processed files in the output folder"""
         if not self.output_dir:
@@ -15,7 +15,11 @@ def main():
     # Create resampling method
     resampling_method = SWARII(
         window_size=config.window_size,
-        desired_frequency=config.desired_frequency
+        desired_frequency=config.desired_frequency,
+        backend=config.resampling_backend,
+        uniform_tolerance=config.uniform_jitter_tolerance,
+        workers=config.resampling_workers,
+        dtype=config.dtype
     )
 
     # Create and show the GUI
@@ -1,5 +1,6 @@
 from utils.config import Config
+from utils.parse_cache import ParseCache
 from utils.resampling import SWARII
-from utils.wbb_file_parser import parse_wbb_file
+from utils.wbb_file_parser import parse_wbb_file, parse_wbb_bytes, iter_wbb_file, ParseStats
 
-__all__ = ['Config', 'parse_wbb_file', 'SWARII']
+__all__ = ['Config', 'parse_wbb_file', 'parse_wbb_bytes', 'iter_wbb_file', 'ParseStats', 'ParseCache', 'SWARII']
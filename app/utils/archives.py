@@ -0,0 +1,79 @@
+import gzip
+import os
+import tarfile
+import zipfile
+
+# Suffixes of the compressed inputs read without extracting them to disk
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+ZIP_SUFFIXES = (".zip",)
+GZIP_SUFFIXES = (".gz",)
+
+
+def archive_kind(file_address):
+    """Return "tar", "zip" or "gzip" for a compressed input, None for a plain file"""
+    name = file_address.lower()
+    if name.endswith(TAR_SUFFIXES):
+        return "tar"
+    if name.endswith(ZIP_SUFFIXES):
+        return "zip"
+    if name.endswith(GZIP_SUFFIXES):
+        return "gzip"
+    return None
+
+
+def archive_members(file_address):
+    """
+    Generator over the recordings of a compressed input, as if it were
+    extracted next to itself
+
+    Yields:
+        Tuples of (member, read), member being the relative path of the
+        extracted file (os.sep separated) and read a callable returning its
+        decompressed bytes. Zip and gzip members can be read in any order and
+        from any thread. Tar members are read while the archive is walked, in
+        a single sequential pass (see iter_tar), so read only returns them.
+    """
+    kind = archive_kind(file_address)
+    if kind == "gzip":
+        member = os.path.basename(file_address)[:-len(".gz")]
+        yield member, lambda: _read_gzip(file_address)
+    elif kind == "zip":
+        with zipfile.ZipFile(file_address) as archive:
+            names = [info.filename for info in archive.infolist() if not info.is_dir()]
+        for name in names:
+            if _inside(name):
+                yield os.path.normpath(name), lambda name=name: _read_zip(file_address, name)
+    elif kind == "tar":
+        for member, data in iter_tar(file_address):
+            yield member, lambda data=data: data
+
+
+def iter_tar(file_address):
+    """
+    Generator over the recordings of a tarball, decompressed in a single
+    sequential pass
+
+    Yields:
+        Tuples of (member, data), member as in archive_members and data its
+        decompressed bytes
+    """
+    with tarfile.open(file_address, "r|*") as archive:
+        for info in archive:
+            if info.isfile() and _inside(info.name):
+                yield os.path.normpath(info.name), archive.extractfile(info).read()
+
+
+def _inside(name):
+    """Whether an archive member would be extracted inside the archive folder"""
+    name = os.path.normpath(name)
+    return not os.path.isabs(name) and name != ".." and not name.startswith(".." + os.sep)
+
+
+def _read_gzip(file_address):
+    with gzip.open(file_address, 'rb') as f:
+        return f.read()
+
+
+def _read_zip(file_address, name):
+    with zipfile.ZipFile(file_address) as archive:
+        return archive.read(name)
@@ -26,6 +26,88 @@ class Config:
     def desired_frequency(self):
         return self._config.get("desired_frequency", 25)
 
+    @property
+    def resampling_backend(self):
+        return self._config.get("resampling_backend", "numpy")
+
+    @property
+    def uniform_jitter_tolerance(self):
+        return self._config.get("uniform_jitter_tolerance", 0.)
+
+    @property
+    def resampling_workers(self):
+        return self._config.get("resampling_workers", 1)
+
+    @property
+    def dtype(self):
+        return self._config.get("dtype", "float64")
+
+    @property
+    def channels(self):
+        return self._config.get("channels", ["x", "y"])
+
+    @property
+    def sweep_parameters(self):
+        """(window_size, desired_frequency) pairs of the parameter sweep"""
+        return [(window_size, desired_frequency)
+                for window_size in self._config.get("sweep_window_sizes", [self.window_size])
+                for desired_frequency in self._config.get("sweep_frequencies", [self.desired_frequency])]
+
+    @property
+    def parse_cache_dir(self):
+        """Folder of the parsed recordings cache, empty to disable it"""
+        return self._config.get("parse_cache_dir", "")
+
+    @property
+    def parse_cache_max_mb(self):
+        return self._config.get("parse_cache_max_mb", 1024)
+
+    @property
+    def streaming_threshold_mb(self):
+        return self._config.get("streaming_threshold_mb", 1024)
+
+    @property
+    def processes(self):
+        """Number of processes handling files in parallel in Process Files"""
+        return self._config.get("processes", 1)
+
+    @property
+    def decompress_workers(self):
+        return self._config.get("decompress_workers", 4)
+
+    @property
+    def use_manifest(self):
+        """Process only the "ok" recordings of the output folder's manifest.json, when there is one"""
+        return self._config.get("use_manifest", False)
+
+    @property
+    def qa(self):
+        """Keyword arguments of utils.qa.check_recording, None when the QA checks are disabled"""
+        if not self._config.get("qa_enabled", True):
+            return None
+        return {"max_gap_fraction": self._config.get("qa_max_gap_fraction", 0.2),
+                "max_stuck": self._config.get("qa_max_stuck_seconds", 2.),
+                "max_duplicate_fraction": self._config.get("qa_max_duplicate_fraction", 0.1)}
+
+    @property
+    def output_frequencies(self):
+        return self._config.get("output_frequencies", [])
+
+    @property
+    def output_format(self):
+        """File format of the outputs: txt, npy, npz, feather or parquet"""
+        return self._config.get("output_format", "txt")
+
+    @property
+    def quantization_step(self):
+        """Quantization step (cm, kg for the weight channels) of the wbbq output format, 0 for lossless"""
+        return self._config.get("quantization_step", 0.0001)
+
+    @property
+    def output_store(self):
+        """Append the outputs to one recordings.wbbs store instead of writing one file per recording"""
+        return self._config.get("output_store", False)
+
     @property
     def max_depth(self):
         return self._config.get("max_depth", 1)
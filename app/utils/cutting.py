@@ -0,0 +1,22 @@
+def cut_recording(time, signal, cut_option, x, y):
+    """
+    Apply a cutting option to a resampled recording
+
+    Args:
+        time: Time stamps, in seconds
+        signal: Samples, one row per time stamp
+        cut_option: 0 for no cut, 1 to cut the first x seconds and the last
+                    y seconds, 2 to cut the first x seconds and keep the y
+                    seconds after
+        x, y: Seconds of the cutting option
+
+    Returns:
+        Tuple of (time, signal) after the cut
+    """
+    if cut_option == 1:
+        mask = (time >= x + time[0]) & (time <= (time[-1] - y))
+    elif cut_option == 2:
+        mask = (time >= x + time[0]) & (time <= (x + time[0] + y))
+    else:
+        return time, signal
+    return time[mask], signal[mask]
@@ -0,0 +1,213 @@
+"""
+Single-file store of the resampled recordings of an output folder (.wbbs)
+
+Recordings are appended one after the other as chunks, each one encoded as a
+.npy file, or as a .wbbq file (see utils.delta_codec) for the wbbq output
+format. The index, written at the end of the file, gives the offset, length,
+format, number of samples, columns and sampling rate of every chunk by
+recording name, so a single recording is read without touching the others.
+
+Layout:
+    header    b"WBBS", version (uint32, little endian)
+    chunks    encoded recordings, back to back
+    index     JSON: {"previous": end of the previous footer, 0 for none,
+              "entries": recording name -> entry}
+    footer    index offset and index length (uint64 each), b"WBBS"
+
+Every flush appends the new chunks, then an index of only these chunks
+that points back to the previous one, so the offsets already indexed never
+change and the file never holds the same index entry twice. A recording
+stored again keeps only its latest chunk in the index; compact drops the
+stale chunks and merges the indexes into one.
+"""
+import io
+import json
+import mmap
+import os
+
+import numpy as np
+
+from utils.delta_codec import decode_output, encode_output
+
+MAGIC = b"WBBS"
+VERSION = 2
+HEADER = MAGIC + np.uint32(VERSION).astype("<u4").tobytes()
+FOOTER = np.dtype([("offset", "<u8"), ("length", "<u8"), ("magic", "S4")])
+# Store of process_files, in the output folder
+STORE_NAME = "recordings.wbbs"
+
+
+def encode_chunk(data, columns, output_format="npy", quantization_step=1e-4):
+    """
+    Encode a recording as a chunk
+
+    Returns:
+        Tuple of (bytes, chunk format): "wbbq" for the wbbq output format,
+        "npy" for any other
+    """
+    if output_format == "wbbq":
+        return encode_output(data, columns, quantization_step), "wbbq"
+    buffer = io.BytesIO()
+    np.save(buffer, np.ascontiguousarray(data))
+    return buffer.getvalue(), "npy"
+
+
+def decode_chunk(chunk, chunk_format, columns=None):
+    """Leading columns of a chunk, as a float64 array, see encode_chunk"""
+    if chunk_format == "wbbq":
+        return decode_output(chunk, columns)[0]
+    data = np.load(io.BytesIO(chunk))
+    return np.asarray(data[:, :columns], dtype=np.float64)
+
+
+class DatasetStore:
+    """
+    Store of resampled recordings in one file, see the module documentation
+
+    Appended chunks are only indexed once flush is called. The file is opened
+    for every operation, so stores can be pickled to pool processes, where
+    they read the recordings indexed when they were sent.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index = {}
+        # Entries of the chunks appended since the last flush, and where the last flushed footer ends
+        self.pending = {}
+        self.last_footer = 0
+        if os.path.exists(path) and os.path.getsize(path):
+            self.index, self.last_footer = self._load_index()
+        else:
+            with open(path, 'wb') as f:
+                f.write(HEADER)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def names(self):
+        """Names of the stored recordings, in the order they were first stored"""
+        return list(self.index)
+
+    def read(self, name, columns=None):
+        """
+        Random access to one recording
+
+        Args:
+            name: Name of the recording
+            columns: Number of leading columns to read, all of them if None
+
+        Returns:
+            float64 array of shape (n, columns)
+        """
+        entry = self.index[name]
+        with open(self.path, 'rb') as f:
+            f.seek(entry["offset"])
+            chunk = f.read(entry["length"])
+        return decode_chunk(chunk, entry["format"], columns)
+
+    def append(self, name, chunk, chunk_format, samples, columns, frequency):
+        """Append an encoded chunk (see encode_chunk), replacing any recording of the same name"""
+        with open(self.path, 'ab') as f:
+            offset = f.tell()
+            f.write(chunk)
+        self.index[name] = {"offset": offset, "length": len(chunk), "format": chunk_format, "samples": samples,
+                            "columns": list(columns), "frequency": frequency}
+        self.pending[name] = self.index[name]
+
+    def flush(self):
+        """Index the chunks appended since the last flush, if any"""
+        if not self.pending:
+            return
+        index = json.dumps({"previous": self.last_footer, "entries": self.pending}).encode()
+        with open(self.path, 'ab') as f:
+            offset = f.tell()
+            f.write(index)
+            f.write(np.array([(offset, len(index), MAGIC)], dtype=FOOTER).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+            self.last_footer = f.tell()
+        self.pending = {}
+
+    def dead_bytes(self):
+        """Bytes compact would save: stale chunks, and the indexes beyond a single one of the indexed chunks"""
+        live = sum(entry["length"] for entry in self.index.values())
+        index = len(json.dumps({"previous": 0, "entries": self.index}).encode()) + FOOTER.itemsize
+        return max(0, os.path.getsize(self.path) - len(HEADER) - live - index)
+
+    def compact(self, min_dead_fraction=0.):
+        """
+        Rewrite the store with only the indexed chunks and a single index
+
+        Args:
+            min_dead_fraction: Only rewrite when dead_bytes are at least this
+                               fraction of the file
+
+        Returns:
+            Whether the store was rewritten
+        """
+        self.flush()
+        if self.dead_bytes() < min_dead_fraction * os.path.getsize(self.path):
+            return False
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        index = {}
+        with open(self.path, 'rb') as source, open(temporary, 'wb') as f:
+            f.write(HEADER)
+            for name, entry in self.index.items():
+                source.seek(entry["offset"])
+                index[name] = dict(entry, offset=f.tell())
+                f.write(source.read(entry["length"]))
+        os.replace(temporary, self.path)
+        self.index = index
+        self.pending = dict(index)
+        self.last_footer = 0
+        self.flush()
+        return True
+
+    def _load_index(self):
+        """
+        Index of the last complete flush, merged with the indexes it points
+        back to, and where its footer ends. A store cut short while chunks
+        were appended (e.g. the run was killed) falls back to the previous
+        index.
+        """
+        with open(self.path, 'rb') as f:
+            if f.read(len(HEADER)) != HEADER:
+                raise ValueError(f"{self.path} is not a version {VERSION} dataset store")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                search_end = len(data)
+                while True:
+                    position = data.rfind(MAGIC, len(HEADER), search_end)
+                    if position < 0:
+                        return {}, 0
+                    search_end = position + len(MAGIC) - 1
+                    last_footer = position + len(MAGIC)
+                    deltas = self._read_indexes(data, last_footer)
+                    if deltas is not None:
+                        break
+        index = {}
+        for delta in reversed(deltas):
+            index.update(delta)
+        return index, last_footer
+
+    @staticmethod
+    def _read_indexes(data, footer_end):
+        """Entries of the index whose footer ends at footer_end and of the ones before it, newest first"""
+        deltas = []
+        while footer_end:
+            footer_start = footer_end - FOOTER.itemsize
+            if footer_start < len(HEADER):
+                return None
+            footer = np.frombuffer(data[footer_start:footer_end], dtype=FOOTER)[0]
+            offset, length = int(footer["offset"]), int(footer["length"])
+            if footer["magic"] != MAGIC or offset + length != footer_start:
+                return None
+            try:
+                index = json.loads(data[offset:footer_start])
+                entries, previous = index["entries"], int(index["previous"])
+            except (ValueError, KeyError, TypeError):
+                return None
+            if previous >= offset:
+                return None
+            deltas.append(entries)
+            footer_end = previous
+        return deltas
@@ -0,0 +1,125 @@
+"""
+Compact archive format of resampled outputs (.wbbq)
+
+Every column is quantized to integers, on a fixed step (e.g. 1e-4 cm), and
+stored as the differences between successive samples: resampled traces are
+smooth, so the differences fit in one or two bytes. The bytes of the
+differences are grouped by significance (all lowest bytes first, ...) and the
+whole is compressed with zlib. A step of 0 stores the float64 bit patterns
+instead, which is lossless; otherwise values are restored within step / 2.
+
+Layout:
+    magic     b"WBBQ"
+    length    uint32 (little endian), length of the header
+    header    JSON: version, samples, columns, steps, first (quantized
+              first value of each column) and dtypes (of the differences)
+    payload   zlib stream of the differences of every column, in order
+"""
+import json
+import zlib
+
+import numpy as np
+
+MAGIC = b"WBBQ"
+VERSION = 1
+# Quantization step of the time column, in seconds, when the others are quantized
+TIME_STEP = 1e-6
+# Smallest integer types the differences are stored in
+DELTA_DTYPES = ("<i1", "<i2", "<i4", "<i8")
+
+
+def _quantize(values, step):
+    if not step:
+        return np.ascontiguousarray(values, dtype="<f8").view("<i8")
+    scaled = np.rint(values / step)
+    if not (np.abs(scaled) < 2. ** 62).all():
+        raise ValueError(f"Values not finite or too large to be quantized on a {step} step")
+    return scaled.astype(np.int64)
+
+
+def encode_output(data, columns, step=1e-4, level=6):
+    """
+    Encode an output
+
+    Args:
+        data: Array of shape (n, len(columns)), the time in the first column
+        columns: Names of the columns
+        step: Quantization step of the other columns, 0 for lossless
+        level: zlib compression level
+
+    Returns:
+        bytes of a .wbbq file
+    """
+    data = np.asarray(data, dtype=np.float64).reshape(-1, len(columns))
+    steps = [TIME_STEP if step else 0.] + [float(step)] * (len(columns) - 1)
+    header = {"version": VERSION, "samples": len(data), "columns": list(columns), "steps": steps,
+              "first": [], "dtypes": []}
+    compressor = zlib.compressobj(level)
+    payload = []
+    for i, column_step in enumerate(steps):
+        quantized = _quantize(data[:, i], column_step)
+        deltas = np.diff(quantized)
+        low, high = (int(deltas.min()), int(deltas.max())) if len(deltas) else (0, 0)
+        dtype = next(d for d in DELTA_DTYPES if np.iinfo(d).min <= low and high <= np.iinfo(d).max)
+        header["first"].append(int(quantized[0]) if len(quantized) else 0)
+        header["dtypes"].append(dtype)
+        # Byte shuffle: row k holds byte k of every difference (wrapping around in lossless mode,
+        # which the wrapping sum of decode_output undoes)
+        shuffled = deltas.astype(dtype).view(np.uint8).reshape(-1, np.dtype(dtype).itemsize).T
+        payload.append(compressor.compress(np.ascontiguousarray(shuffled).tobytes()))
+    payload.append(compressor.flush())
+
+    header = json.dumps(header).encode()
+    return b"".join([MAGIC, np.uint32(len(header)).astype("<u4").tobytes(), header] + payload)
+
+
+def decode_output(buffer, columns=None):
+    """
+    Decode an output encoded by encode_output
+
+    Args:
+        buffer: bytes of a .wbbq file
+        columns: Number of leading columns to decode, all of them if None
+
+    Returns:
+        Tuple of (float64 array of shape (n, columns), column names)
+    """
+    if buffer[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a WBBQ file")
+    length = int(np.frombuffer(buffer, dtype="<u4", count=1, offset=len(MAGIC))[0])
+    start = len(MAGIC) + 4
+    header = json.loads(buffer[start:start + length])
+    if header["version"] != VERSION:
+        raise ValueError(f"Unsupported WBBQ version {header['version']}")
+    names = header["columns"][:columns]
+    samples = header["samples"]
+    data = np.empty((samples, len(names)))
+    if not samples:
+        return data, names
+
+    payload = zlib.decompress(buffer[start + length:])
+    offset = 0
+    for i in range(len(names)):
+        dtype = np.dtype(header["dtypes"][i])
+        size = (samples - 1) * dtype.itemsize
+        shuffled = np.frombuffer(payload, dtype=np.uint8, count=size, offset=offset).reshape(dtype.itemsize, -1)
+        offset += size
+        quantized = np.empty(samples, dtype=np.int64)
+        quantized[0] = header["first"][i]
+        np.cumsum(np.ascontiguousarray(shuffled.T).view(dtype).ravel(), dtype=np.int64, out=quantized[1:])
+        quantized[1:] += quantized[0]
+        step = header["steps"][i]
+        data[:, i] = quantized * step if step else quantized.view(np.float64)
+    return data, names
+
+
+def write_delta_output(output_path, data, columns, step=1e-4):
+    """Save an output as a .wbbq file"""
+    with open(output_path, 'wb') as f:
+        f.write(encode_output(data, columns, step))
+
+
+def read_delta_output(output_path, columns=None):
+    """Read the leading columns of a .wbbq file, see decode_output"""
+    with open(output_path, 'rb') as f:
+        return decode_output(f.read(), columns)[0]
@@ -0,0 +1,140 @@
+import csv
+import json
+
+import numpy as np
+
+from utils.wbb_binary import HEADER, MAGIC
+
+# Columns of a manifest, in order
+MANIFEST_FIELDS = ("file", "size", "columns", "first_time", "last_time", "duration", "estimated_samples",
+                   "estimated_frequency", "status")
+
+
+def scan_recording(f, size, tail_size=4096):
+    """
+    Describe a raw WBB recording from its first and last lines only
+
+    Args:
+        f: Seekable binary file object of the recording
+        size: Size of the recording in bytes
+        tail_size: Number of bytes read at the end of the recording
+
+    Returns:
+        Dict with the MANIFEST_FIELDS but "file". The sample count of text
+        recordings is estimated from the size and the mean length of the last
+        lines; binary containers give it exactly. status is "ok",
+        "empty" (no data line), "unreadable" (first data line is not numeric)
+        or "truncated" (last line cut short).
+    """
+    row = {"size": size, "columns": 0, "first_time": 0., "last_time": 0., "duration": 0.,
+           "estimated_samples": 0, "estimated_frequency": 0., "status": "empty"}
+
+    if f.read(len(MAGIC)) == MAGIC:
+        return _scan_binary(f, row)
+    f.seek(0)
+
+    # Skip header lines
+    f.readline()
+    f.readline()
+    body_start = f.tell()
+
+    first_line = f.readline()
+    while first_line and not first_line.strip():
+        first_line = f.readline()
+    if not first_line:
+        return row
+    values = first_line.split()
+    try:
+        row["first_time"] = 0.001 * float(values[0])
+        float(values[-1])
+    except ValueError:
+        row["status"] = "unreadable"
+        return row
+    row["columns"] = len(values)
+
+    tail_start = max(body_start, size - tail_size)
+    f.seek(tail_start)
+    tail = f.read()
+    lines = tail.split(b"\n")
+    if tail_start > body_start:
+        lines = lines[1:]  # The first line read is only the end of a line
+    complete = [line for line in lines if line.strip()]
+
+    # A last line without a final newline is fine as long as it holds a full sample
+    last_values = complete[-1].split() if complete else values
+    truncated = not _is_sample(last_values, row["columns"])
+    if truncated:
+        complete = complete[:-1]
+        last_values = complete[-1].split() if complete else values
+    try:
+        row["last_time"] = 0.001 * float(last_values[0])
+    except ValueError:
+        row["last_time"] = row["first_time"]
+        truncated = True
+
+    line_length = (sum(len(line) + 1 for line in complete) / len(complete)) if complete else len(first_line)
+    row["estimated_samples"] = int(round((size - body_start) / line_length))
+    row["duration"] = row["last_time"] - row["first_time"]
+    if row["duration"] > 0:
+        row["estimated_frequency"] = (row["estimated_samples"] - 1) / row["duration"]
+    row["status"] = "truncated" if truncated else "ok"
+    return row
+
+
+def _is_sample(values, columns):
+    """Whether the values of a line make a complete sample of columns values"""
+    if len(values) != columns:
+        return False
+    try:
+        for value in values:
+            float(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _scan_binary(f, row):
+    """scan_recording of a binary container, whose sample count is exact"""
+    f.seek(0)
+    header = np.frombuffer(f.read(HEADER.itemsize), dtype=HEADER)[0]
+    samples = int(header["samples"])
+    row["columns"] = 1 + int(header["channels"])
+    row["estimated_samples"] = samples
+    if not samples:
+        return row
+    first_time = np.frombuffer(f.read(8), dtype="<i8")[0]
+    f.seek(HEADER.itemsize + 8 * (samples - 1))
+    last_time = np.frombuffer(f.read(8), dtype="<i8")[0]
+    row["first_time"] = 0.001 * float(first_time)
+    row["last_time"] = 0.001 * float(last_time)
+    row["duration"] = row["last_time"] - row["first_time"]
+    if row["duration"] > 0:
+        row["estimated_frequency"] = (samples - 1) / row["duration"]
+    expected = HEADER.itemsize + samples * (8 + 4 * int(header["channels"]))
+    row["status"] = "truncated" if row["size"] < expected else "ok"
+    return row
+
+
+def write_manifest(manifest_path, rows):
+    """Save manifest rows as JSON (.json) or CSV (any other extension)"""
+    with open(manifest_path, 'w', newline='') as f:
+        if manifest_path.endswith(".json"):
+            json.dump([{field: row[field] for field in MANIFEST_FIELDS} for row in rows], f, indent=2)
+        else:
+            writer = csv.DictWriter(f, fieldnames=MANIFEST_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def read_manifest(manifest_path):
+    """Load the rows of a manifest written by write_manifest"""
+    with open(manifest_path, 'r', newline='') as f:
+        if manifest_path.endswith(".json"):
+            return json.load(f)
+        rows = list(csv.DictReader(f))
+    for row in rows:
+        for field in ("size", "columns", "estimated_samples"):
+            row[field] = int(row[field])
+        for field in ("first_time", "last_time", "duration", "estimated_frequency"):
+            row[field] = float(row[field])
+    return rows
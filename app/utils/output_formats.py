@@ -0,0 +1,144 @@
+"""
+File formats of the resampled outputs
+
+    txt      space separated text with a header line (.csv), the default
+    npy      NumPy array of shape (n, columns), without the column names
+    npz      NumPy archive of the "data" array and its "columns" names
+    feather  Arrow Feather file, one named column per channel (needs pyarrow)
+    parquet  Parquet file, one named column per channel (needs pyarrow)
+    wbbq     quantized, delta encoded and compressed archive format, see
+             utils.delta_codec
+
+Every format holds the same columns in the same order: Time(s), X(cm),
+Y(cm), then the other channels.
+"""
+import os
+
+import numpy as np
+
+from utils.delta_codec import read_delta_output, write_delta_output
+from utils.wbb_file_parser import CHANNEL_LABELS
+
+try:
+    import pyarrow
+    import pyarrow.feather as feather
+    import pyarrow.parquet as parquet
+except ImportError:
+    pyarrow = None
+
+# Output format name -> file extension
+OUTPUT_FORMATS = {"txt": ".csv", "npy": ".npy", "npz": ".npz", "feather": ".feather", "parquet": ".parquet",
+                  "wbbq": ".wbbq"}
+# Formats written through pyarrow
+ARROW_FORMATS = ("feather", "parquet")
+# Number format of the txt outputs
+TEXT_FORMAT = "%.9f"
+
+
+def get_output_format(name):
+    """
+    Resolve a format name to the format actually written. Unknown names
+    raise a ValueError; Arrow formats fall back to "npz" when pyarrow is not
+    installed.
+    """
+    if name not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{name}', expected one of {sorted(OUTPUT_FORMATS)}")
+    if name in ARROW_FORMATS and pyarrow is None:
+        return "npz"
+    return name
+
+
+def is_output_file(file):
+    """Whether a file name has the extension of an output format"""
+    return file.endswith(tuple(OUTPUT_FORMATS.values()))
+
+
+def output_stem(file):
+    """File name without the extension of its output format, if any"""
+    for extension in OUTPUT_FORMATS.values():
+        if file.endswith(extension):
+            return file[:-len(extension)]
+    return file
+
+
+def output_columns(channels):
+    """Names of the columns of an output: the time, then one column per channel"""
+    return ["Time(s)"] + [CHANNEL_LABELS[c] for c in channels]
+
+
+def write_output(output_path, data, columns, output_format="txt", quantization_step=1e-4):
+    """
+    Save an output
+
+    Args:
+        output_path: Path of the file, with the extension of output_format
+        data: Array of shape (n, len(columns))
+        columns: Names of the columns
+        quantization_step: Quantization step of the wbbq format, 0 for lossless
+    """
+    if output_format == "txt":
+        with open(output_path, 'w') as f:
+            f.write(" ".join(columns) + "\n")
+            np.savetxt(f, data, fmt=TEXT_FORMAT, delimiter=" ")
+    elif output_format == "npy":
+        np.save(output_path, data)
+    elif output_format == "npz":
+        np.savez(output_path, data=data, columns=np.array(columns))
+    elif output_format in ARROW_FORMATS:
+        table = pyarrow.table({name: np.ascontiguousarray(data[:, i]) for i, name in enumerate(columns)})
+        if output_format == "feather":
+            feather.write_feather(table, output_path)
+        else:
+            parquet.write_table(table, output_path)
+    elif output_format == "wbbq":
+        write_delta_output(output_path, data, columns, quantization_step)
+    else:
+        raise ValueError(f"Unknown output format '{output_format}'")
+
+
+def write_text_blocks(output_path, columns, blocks):
+    """
+    Save a txt output block by block, e.g. from a stream
+
+    Args:
+        blocks: Iterable of (time, signal) arrays, written as write_output
+                would write their concatenation
+    """
+    with open(output_path, 'w') as f:
+        f.write(" ".join(columns) + "\n")
+        for time, signal in blocks:
+            np.savetxt(f, np.column_stack((time, signal)), fmt=TEXT_FORMAT, delimiter=" ")
+
+
+def read_output(output_path, columns=None):
+    """
+    Read an output of any format, from its extension
+
+    Args:
+        columns: Number of leading columns to read, all of them if None
+
+    Returns:
+        float64 array of shape (n, columns)
+    """
+    extension = os.path.splitext(output_path)[1]
+    if extension == ".npy":
+        # Only the columns read are copied out of the memory map
+        data = np.array(np.load(output_path, mmap_mode='r')[:, :columns], dtype=np.float64)
+    elif extension == ".npz":
+        with np.load(output_path) as archive:
+            data = archive["data"][:, :columns]
+    elif extension == ".wbbq":
+        data = read_delta_output(output_path, columns)
+    elif extension in (".feather", ".parquet"):
+        if pyarrow is None:
+            raise ImportError(f"pyarrow is needed to read {output_path}")
+        if extension == ".feather":
+            table = feather.read_table(output_path, columns=None if columns is None else list(range(columns)))
+        else:
+            names = parquet.ParquetFile(output_path).schema_arrow.names
+            table = parquet.read_table(output_path, columns=names[:columns])
+        data = np.column_stack([column.to_numpy() for column in table.columns])
+    else:
+        usecols = None if columns is None else range(columns)
+        data = np.loadtxt(output_path, skiprows=1, usecols=usecols, ndmin=2)
+    return np.asarray(data, dtype=np.float64)
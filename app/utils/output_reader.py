@@ -0,0 +1,48 @@
+import os
+
+from utils.dataset_store import STORE_NAME, DatasetStore
+from utils.output_formats import is_output_file, read_output
+
+# Subfolders of an output folder that hold no main output
+SIDE_FOLDERS = ("_csv", "_images", "_rates", "_qa", "_sweep")
+
+
+def load_output(file_path):
+    """
+    Read the Time, X and Y columns of a resampled output file
+
+    The first three columns of every output format are Time(s), X(cm) and
+    Y(cm), see utils.output_formats. Text outputs are decoded by NumPy's C
+    reader instead of pandas' regex separator engine.
+
+    Args:
+        file_path: Path of the output file
+
+    Returns:
+        float64 array of shape (n, 3)
+    """
+    return read_output(file_path, columns=3)
+
+
+def iter_outputs(output_dir):
+    """
+    Yield (name, load) for every main output of an output folder: the
+    recordings of its DatasetStore, if any, then the output files outside
+    SIDE_FOLDERS. name is the store name or the file path; load() returns
+    the array of load_output.
+    """
+    store_path = os.path.join(output_dir, STORE_NAME)
+    if os.path.exists(store_path):
+        store = DatasetStore(store_path)
+        for name in store.names():
+            if not name.startswith("_rates/"):
+                yield name, lambda name=name: store.read(name, columns=3)
+
+    for root, dirs, files in os.walk(output_dir):
+        if os.path.relpath(root, output_dir) == ".":
+            # Side folders are only the top level ones, whatever the output folder itself is called
+            dirs[:] = [folder for folder in dirs if folder not in SIDE_FOLDERS]
+        for file in files:
+            if is_output_file(file):
+                file_path = os.path.join(root, file)
+                yield file_path, lambda file_path=file_path: load_output(file_path)
@@ -0,0 +1,122 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.run_manifest import content_hash
+
+
+class ParseCache:
+    """
+    On-disk cache of parsed recordings, one .npz file per recording
+
+    Entries are keyed by the path, size, modification time and content hash
+    of the raw file, together with the dtype and channels it was parsed with,
+    so an edited or replaced file is never served from the cache. When the
+    cache grows past max_bytes the least recently used entries are removed.
+
+    The directory is listed once per instance (e.g. once per pool process);
+    from then on the entries and their total size are tracked in memory, in
+    least recently used order. Entries another process adds meanwhile are
+    only counted by the instances created after them.
+    """
+
+    def __init__(self, directory, max_bytes=2 ** 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # Entry file name -> size in bytes, least recently used first; listed on first use
+        self._entries = None
+        self._total = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def __getstate__(self):
+        # Every process lists the directory itself
+        state = dict(self.__dict__)
+        state["_entries"], state["_total"] = None, 0
+        return state
+
+    def key(self, file_address, dtype, channels, file_hash=None):
+        """
+        Cache key of a raw file parsed with dtype and channels
+
+        file_hash is the content_hash of the file when the caller already has
+        it, e.g. from a RunManifest fingerprint, which only hashes files
+        whose size or modification time changed. Otherwise the file is hashed.
+        """
+        info = os.stat(file_address)
+        if file_hash is None:
+            file_hash = content_hash(file_address)
+        key = hashlib.blake2b(digest_size=16)
+        for part in (os.path.abspath(file_address), info.st_size, info.st_mtime_ns, file_hash,
+                     np.dtype(dtype).str, ",".join(channels)):
+            key.update(f"{part}\0".encode())
+        return key.hexdigest()
+
+    def load(self, key):
+        """
+        Returns:
+            Tuple of (time, signal, samples, columns, max_delta), or None when
+            the key is not cached
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as entry:
+                cached = (entry["time"], entry["signal"], int(entry["samples"]),
+                          int(entry["columns"]) if entry["columns"] >= 0 else None, float(entry["max_delta"]))
+        except (OSError, KeyError, ValueError):
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)  # Most recently used, for the instances listing the directory later
+        except FileNotFoundError:
+            pass  # Evicted by another process meanwhile
+        entries = self._listed()
+        if key + ".npz" in entries:
+            entries.move_to_end(key + ".npz")
+        self.hits += 1
+        return cached
+
+    def store(self, key, time, signal, samples, columns, max_delta):
+        """Save a parsed recording, then evict old entries past max_bytes"""
+        path = self._path(key)
+        temporary = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(temporary, time=time, signal=signal, samples=samples,
+                 columns=-1 if columns is None else columns, max_delta=max_delta)
+        os.replace(temporary, path)
+        entries = self._listed()
+        self._total -= entries.pop(key + ".npz", 0)
+        entries[key + ".npz"] = os.path.getsize(path)
+        self._total += entries[key + ".npz"]
+        self._evict()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def _listed(self):
+        """Entries of the cache, listing the directory on first use"""
+        if self._entries is None:
+            entries = []
+            for name in os.listdir(self.directory):
+                if name.endswith(".npz") and not name.endswith(".tmp.npz"):
+                    try:
+                        info = os.stat(os.path.join(self.directory, name))
+                    except FileNotFoundError:
+                        continue  # Evicted by another process
+                    entries.append((info.st_mtime_ns, name, info.st_size))
+            self._entries = OrderedDict((name, size) for _, name, size in sorted(entries))
+            self._total = sum(self._entries.values())
+        return self._entries
+
+    def _evict(self):
+        """Remove the least recently used entries until the cache fits in max_bytes"""
+        entries = self._listed()
+        while self._total > self.max_bytes and entries:
+            name, size = entries.popitem(last=False)
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass  # Evicted by another process
+            self._total -= size
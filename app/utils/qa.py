@@ -0,0 +1,123 @@
+import csv
+
+import numpy as np
+
+# Upper edges of the gap histogram bins, in window sizes (the last bin is open)
+GAP_BINS = (0.25, 0.5, 1., 2., 4.)
+
+# Columns of a QA report, in order
+QA_FIELDS = ("file", "status", "issues", "samples", "columns", "backward_steps", "duplicate_times",
+             "gaps_over_window", "largest_gap", "gap_time", "gap_histogram", "longest_stuck")
+
+
+class QAReport:
+    """
+    Quality checks of one parsed recording, see check_recording
+
+    Attributes:
+        status: "ok", "warn" (processed, but worth a look), "reject" (not
+                processed) or "skipped (streamed)" (processed block by block,
+                without the checks)
+        issues: List of the reasons of the status
+        gap_histogram: Number of time steps in each bin of GAP_BINS window sizes
+        longest_stuck: Longest run of identical consecutive samples, in seconds
+    """
+
+    def __init__(self, file=None):
+        self.file = file
+        self.status = "ok"
+        self.issues = []
+        self.samples = 0
+        self.columns = ""
+        self.backward_steps = 0
+        self.duplicate_times = 0
+        self.gaps_over_window = 0
+        self.largest_gap = 0.
+        self.gap_time = 0.
+        self.gap_histogram = []
+        self.longest_stuck = 0.
+
+    def flag(self, status, issue):
+        """Record an issue, keeping the worst status"""
+        self.issues.append(issue)
+        if status == "reject" or self.status == "ok":
+            self.status = status
+
+    def row(self):
+        values = {field: getattr(self, field) for field in QA_FIELDS}
+        values["issues"] = "; ".join(self.issues)
+        values["gap_histogram"] = " ".join(str(count) for count in self.gap_histogram)
+        return values
+
+
+def check_recording(time, signal, window_size, widths=None, max_gap_fraction=0.2, max_stuck=2.,
+                    max_duplicate_fraction=0.1):
+    """
+    Vectorized quality checks of a parsed recording, run before resampling
+
+    Rejected: fewer than two samples, time stamps going backwards, or more
+    than max_gap_fraction of the duration in gaps longer than window_size
+    (empty SWARII windows).
+    Warned: lines with different numbers of values, any gap longer than
+    window_size, more than max_duplicate_fraction of duplicate time stamps
+    (the board repeats a few of them), or a run of identical samples longer
+    than max_stuck seconds.
+
+    Args:
+        time, signal: Output of parse_wbb_file
+        window_size: SWARII window size, in seconds
+        widths: ParseStats.widths of a text recording: values per line ->
+                number of lines
+
+    Returns:
+        QAReport
+    """
+    report = QAReport()
+    report.samples = len(time)
+    if widths is not None:
+        report.columns = " ".join(f"{width}x{count}" for width, count in sorted(widths.items()))
+        if len(widths) > 1:
+            report.flag("warn", f"lines with {len(widths)} different numbers of values")
+    if len(time) < 2:
+        report.flag("reject", "fewer than 2 samples")
+        return report
+
+    steps = np.diff(time)
+    report.backward_steps = int(np.count_nonzero(steps < 0))
+    report.duplicate_times = int(np.count_nonzero(steps == 0))
+    gaps = steps > window_size
+    report.gaps_over_window = int(np.count_nonzero(gaps))
+    report.largest_gap = float(steps.max())
+    report.gap_time = float(steps[gaps].sum())
+    edges = np.concatenate(([-np.inf], np.array(GAP_BINS) * window_size, [np.inf]))
+    report.gap_histogram = np.histogram(steps, bins=edges)[0].tolist()
+
+    signal = signal.reshape(len(time), -1)
+    stuck = np.all(signal[1:] == signal[:-1], axis=1)
+    if stuck.any():
+        # Runs of identical samples: from the sample before the first repeat to the last repeat
+        changes = np.diff(np.concatenate(([False], stuck, [False])).astype(np.int8))
+        run_starts, run_ends = np.flatnonzero(changes == 1), np.flatnonzero(changes == -1)
+        report.longest_stuck = float((time[run_ends] - time[run_starts]).max())
+
+    duration = time[-1] - time[0]
+    if report.backward_steps:
+        report.flag("reject", f"{report.backward_steps} time stamps going backwards")
+    if duration > 0 and report.gap_time > max_gap_fraction * duration:
+        report.flag("reject", f"{report.gap_time:.2f} s of {duration:.2f} s in gaps over {window_size} s")
+    elif report.gaps_over_window:
+        report.flag("warn", f"{report.gaps_over_window} gaps over {window_size} s ({report.gap_time:.2f} s)")
+    if report.duplicate_times > max_duplicate_fraction * len(steps):
+        report.flag("warn", f"{report.duplicate_times} duplicate time stamps")
+    if report.longest_stuck > max_stuck:
+        report.flag("warn", f"identical samples for {report.longest_stuck:.2f} s")
+    return report
+
+
+def write_qa_report(report_path, reports):
+    """Save QA reports as CSV, one row per file"""
+    with open(report_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=QA_FIELDS)
+        writer.writeheader()
+        for report in reports:
+            writer.writerow(report.row())
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+
+HASH_BLOCK_SIZE = 2 ** 20
+
+
+def content_hash(file_address=None, data=None):
+    """blake2b digest of the content of a file, or of bytes already in memory"""
+    content = hashlib.blake2b(digest_size=16)
+    if data is not None:
+        content.update(data)
+    else:
+        with open(file_address, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+                content.update(block)
+    return content.hexdigest()
+
+
+def source_version(*paths):
+    """Version of the code shaping the outputs: digest of the given source files"""
+    version = hashlib.blake2b(digest_size=8)
+    for path in paths:
+        with open(path, 'rb') as f:
+            version.update(f.read())
+    return version.hexdigest()
+
+
+class RunManifest:
+    """
+    Record of the outputs of process_files, saved as JSON in the output folder
+
+    Every output (path relative to the output folder) is recorded with the
+    content hash of its input, the parameters it was computed with and the
+    code version. An output is up to date when it exists and all three are
+    unchanged; the others are computed again. Inputs whose size and
+    modification time did not change are not hashed again.
+    """
+
+    def __init__(self, path, parameters, code_version):
+        self.path = path
+        self.parameters = parameters
+        self.code_version = code_version
+        # Records added since the manifest was loaded, see merge
+        self.updated = {}
+        # Whether records were added since the last save
+        self.changed = False
+        try:
+            with open(path, 'r') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def fingerprint(self, output_key, file_path, read=None):
+        """
+        Input description of an output: dict of size, mtime_ns and hash of
+        the file, or only the hash of the bytes of an archive member
+        """
+        if read is not None:
+            return {"hash": content_hash(data=read())}
+        info = os.stat(file_path)
+        fingerprint = {"size": info.st_size, "mtime_ns": info.st_mtime_ns}
+        entry = self.entries.get(output_key)
+        if entry is not None and all(entry["input"].get(k) == v for k, v in fingerprint.items()):
+            fingerprint["hash"] = entry["input"]["hash"]
+        else:
+            fingerprint["hash"] = content_hash(file_path)
+        return fingerprint
+
+    def stale(self, output_key, exists, fingerprint):
+        """Why an output (which exists or not) must be computed again, or None when it is up to date"""
+        entry = self.entries.get(output_key)
+        if entry is None or not exists:
+            return "not processed yet"
+        if entry["input"]["hash"] != fingerprint["hash"]:
+            return "input changed"
+        if entry["parameters"] != self.parameters:
+            changed = sorted(k for k in set(entry["parameters"]) | set(self.parameters)
+                             if entry["parameters"].get(k) != self.parameters.get(k))
+            return f"{', '.join(changed)} changed"
+        if entry["code_version"] != self.code_version:
+            return "code changed"
+        return None
+
+    def record(self, output_key, file_path, fingerprint):
+        """Record an output computed from file_path with the current parameters"""
+        self.merge({output_key: {"input_file": file_path, "input": fingerprint,
+                                 "parameters": self.parameters, "code_version": self.code_version}})
+
+    def merge(self, records):
+        """Add records, e.g. the updated records of a pool process"""
+        self.entries.update(records)
+        self.updated.update(records)
+        self.changed = self.changed or bool(records)
+
+    def save(self):
+        """Write the manifest atomically: a run killed while saving keeps the previous one"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(temporary, self.path)
+        self.changed = False
@@ -0,0 +1,99 @@
+"""
+Compact binary container of raw WBB recordings
+
+Layout (little endian):
+    header    16 bytes: magic b"WBBX", version (uint16), number of channels
+              (uint16), number of samples n (uint64)
+    time      n int64: time stamps in ms
+    channels  n x channels float32, row by row, in the order of the raw
+              text columns 1 to 7 (cell_1 .. cell_4, x, y, weight)
+
+The container is about half the size of the text file, and is read
+with np.memmap / np.frombuffer instead of being decoded.
+
+Convert a folder of text recordings (same tree and file names):
+    python convert_wbb.py <input_dir> <output_dir>
+"""
+import os
+
+import numpy as np
+
+MAGIC = b"WBBX"
+VERSION = 1
+HEADER = np.dtype([("magic", "S4"), ("version", "<u2"), ("channels", "<u2"), ("samples", "<u8")])
+RAW_CHANNELS = ("cell_1", "cell_2", "cell_3", "cell_4", "x", "y", "weight")
+
+
+def is_wbb_binary(file_address):
+    """Whether a file is a binary WBB container"""
+    with open(file_address, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_wbb_binary(buffer):
+    """
+    Views of the content of a container, without copying it
+
+    Args:
+        buffer: np.memmap of the file, or any bytes-like object
+
+    Returns:
+        Tuple of (time_ms, channels): int64 array of shape (n,) and float32
+        array of shape (n, len(RAW_CHANNELS))
+    """
+    raw = np.frombuffer(buffer, dtype=np.uint8)
+    header = raw[:HEADER.itemsize].view(HEADER)[0]
+    if header["magic"] != MAGIC or header["version"] != VERSION:
+        raise ValueError("Not a version 1 WBB binary container")
+    samples, channels = int(header["samples"]), int(header["channels"])
+    time_end = HEADER.itemsize + 8 * samples
+    time_ms = raw[HEADER.itemsize:time_end].view("<i8")
+    signal = raw[time_end:time_end + 4 * samples * channels].view("<f4").reshape(samples, channels)
+    return time_ms, signal
+
+
+def write_wbb_binary(file_address, time_ms, signal):
+    """Save int64 ms time stamps and the float32 raw channels as a container"""
+    time_ms = np.ascontiguousarray(time_ms, dtype="<i8")
+    signal = np.ascontiguousarray(signal, dtype="<f4")
+    header = np.array([(MAGIC, VERSION, signal.shape[1], len(time_ms))], dtype=HEADER)
+    with open(file_address, 'wb') as f:
+        f.write(header.tobytes())
+        f.write(time_ms.tobytes())
+        f.write(signal.tobytes())
+
+
+def convert_wbb_file(text_address, binary_address):
+    """Convert a text WBB recording to a binary container"""
+    # Imported here, the text parser itself detects containers through this module
+    from utils.wbb_file_parser import parse_wbb_file
+
+    time, signal = parse_wbb_file(text_address, dtype=np.float32, channels=RAW_CHANNELS, use_mmap=False)
+    time_ms = np.rint(time * 1000.).astype(np.int64)
+    write_wbb_binary(binary_address, time_ms, signal.reshape(len(time_ms), len(RAW_CHANNELS)))
+
+
+def convert_tree(input_dir, output_dir, log_callback=None):
+    """
+    Convert every text recording of input_dir to output_dir, keeping the tree and the file names
+
+    Returns:
+        Tuple of (converted, failed) lists of text recording paths
+    """
+    converted, failed = [], []
+    for root, _, files in os.walk(input_dir):
+        for file in files:
+            text_address = os.path.join(root, file)
+            binary_address = os.path.join(output_dir, os.path.relpath(text_address, input_dir))
+            os.makedirs(os.path.dirname(binary_address), exist_ok=True)
+            try:
+                convert_wbb_file(text_address, binary_address)
+            except Exception as e:
+                failed.append(text_address)
+                if log_callback:
+                    log_callback(f"Error converting {text_address}: {e}", color="red")
+                continue
+            converted.append(text_address)
+            if log_callback:
+                log_callback(f"Converted {text_address}", color="green")
+    return converted, failed
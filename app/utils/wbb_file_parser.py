@@ -1,34 +1,394 @@
+import io
+import mmap
+import os
+import re
+
 import numpy as np
 
+from utils.wbb_binary import MAGIC, is_wbb_binary, read_wbb_binary
+
+# Column of every channel in the raw WBB lines (column 0 is the timestamp in ms)
+CHANNEL_COLUMNS = {
+    "cell_1": 1,
+    "cell_2": 2,
+    "cell_3": 3,
+    "cell_4": 4,
+    "x": 5,
+    "y": 6,
+    "weight": 7,
+}
+
+# Header label of every channel in the resampled output files
+CHANNEL_LABELS = {
+    "cell_1": "Cell1(kg)",
+    "cell_2": "Cell2(kg)",
+    "cell_3": "Cell3(kg)",
+    "cell_4": "Cell4(kg)",
+    "x": "X(cm)",
+    "y": "Y(cm)",
+    "weight": "Weight(kg)",
+}
+
+DEFAULT_CHANNELS = ("x", "y")
+
+# Files from this size on are read through mmap, block by block
+MMAP_THRESHOLD = 256 * 2 ** 20
+MMAP_BLOCK_SIZE = 4 * 2 ** 20
 
-def parse_wbb_file(file_address):
+
+class ParseStats:
+    """
+    Diagnostics of one parse_wbb_file call
+
+    Attributes:
+        file_address: Path of the parsed file
+        samples: Number of data lines read
+        columns: Number of values on the first data line
+        max_delta: Largest gap between two consecutive timestamps, in seconds
+        method: "vectorized", "mmap", "stream", "binary", "cache" or "loop"
+                (per-line fallback for unreadable lines)
+        widths: With count_widths, dict values per line -> number of lines,
+                counted from the text as it is decoded. None when not
+                counted, or when the file was not decoded from text (binary
+                containers and parse cache hits).
+    """
+
+    def __init__(self, file_address=None, count_widths=False):
+        self.file_address = file_address
+        self.samples = 0
+        self.columns = None
+        self.max_delta = 0.
+        self.method = None
+        self.widths = {} if count_widths else None
+
+    def __repr__(self):
+        return (f"ParseStats(file_address={self.file_address!r}, samples={self.samples}, "
+                f"columns={self.columns}, max_delta={self.max_delta}, method={self.method!r})")
+
+
+def parse_wbb_file(file_address, dtype=np.float64, channels=DEFAULT_CHANNELS, stats=None, use_mmap=None,
+                   cache=None, file_hash=None):
     """
     Parse Nintendo Wii Board data files
 
     Args:
         file_address: Path to the file
+        dtype: Floating type of the signal array (np.float64 or np.float32).
+               The time array is always float64.
+        channels: Names of the signal columns to keep, in order (keys of
+                  CHANNEL_COLUMNS). Defaults to the COP X and Y.
+        stats: Optional ParseStats filled with the diagnostics of the file
+        use_mmap: Read the file through mmap, decoding it block by block into
+                  preallocated arrays. Peak memory stays close to the size of
+                  the returned arrays. Defaults to files of MMAP_THRESHOLD
+                  bytes or more.
+        cache: Optional ParseCache consulted before decoding the file, and
+               filled after decoding it
+        file_hash: content_hash of the file, if already known, so the cache
+                   does not hash it again (see ParseCache.key)
+
+    Binary containers (see utils.wbb_binary) are detected and memory-mapped
+    instead of decoded. The signal array is then a view of the file when
+    dtype is np.float32 and the channels are consecutive raw columns.
 
     Returns:
-        Tuple of (time_array, signal_array)
+        Tuple of (time_array, signal_array), signal_array having one column
+        per channel
     """
-    time = []
-    signal = []
+    columns = [CHANNEL_COLUMNS[channel] for channel in channels]
+    if stats is None:
+        stats = ParseStats()
+    stats.file_address = file_address
+    if is_wbb_binary(file_address):
+        return _parse_binary(np.memmap(file_address, dtype=np.uint8, mode='r'), columns, dtype, stats)
+    if cache is not None:
+        key = cache.key(file_address, dtype, channels, file_hash)
+        cached = cache.load(key)
+        if cached is not None:
+            time, signal, stats.samples, stats.columns, stats.max_delta = cached
+            stats.method = "cache"
+            stats.widths = None
+            return time, signal
+        time, signal = parse_wbb_file(file_address, dtype, channels, stats, use_mmap)
+        cache.store(key, time, signal, stats.samples, stats.columns, stats.max_delta)
+        return time, signal
+
+    if use_mmap is None:
+        use_mmap = os.path.getsize(file_address) >= MMAP_THRESHOLD
+    if use_mmap:
+        return _parse_mapped(file_address, columns, dtype, stats)
+
+    with open(file_address, 'rb') as f:
+        # Skip header lines
+        f.readline()
+        f.readline()
+        body = f.read()
+
+    stats.samples = 0
+    stats.max_delta = 0.
+    stats.method = "vectorized"
+    time, signal = _decode_block(body, columns, dtype, stats)
+    if not stats.samples:
+        signal = np.array([], dtype=dtype)
+    return time, signal
+
+
+def parse_wbb_bytes(data, dtype=np.float64, channels=DEFAULT_CHANNELS, stats=None):
+    """
+    Parse the content of a Nintendo Wii Board data file already in memory,
+    e.g. a member of a compressed archive. Arguments and output as in
+    parse_wbb_file.
+    """
+    columns = [CHANNEL_COLUMNS[channel] for channel in channels]
+    if stats is None:
+        stats = ParseStats()
+    if data[:len(MAGIC)] == MAGIC:
+        return _parse_binary(data, columns, dtype, stats)
+
+    # Skip header lines
+    start = 0
+    for _ in range(2):
+        end = data.find(b"\n", start)
+        start = len(data) if end < 0 else end + 1
+
+    stats.samples = 0
+    stats.max_delta = 0.
+    stats.method = "vectorized"
+    time, signal = _decode_block(data[start:], columns, dtype, stats)
+    if not stats.samples:
+        signal = np.array([], dtype=dtype)
+    return time, signal
+
+
+def _parse_binary(buffer, columns, dtype, stats):
+    """Read the channels of a binary container, as views of buffer where possible"""
+    time_ms, raw_signal = read_wbb_binary(buffer)
+    time = 0.001 * time_ms  # Convert to seconds
+    first = columns[0] - 1
+    if columns == list(range(columns[0], columns[0] + len(columns))):
+        signal = raw_signal[:, first:first + len(columns)]
+    else:
+        signal = raw_signal[:, [column - 1 for column in columns]]
+    signal = signal.astype(dtype, copy=False)
+
+    stats.samples = len(time)
+    stats.columns = 1 + raw_signal.shape[1]
+    stats.max_delta = max(0., float(np.diff(time).max())) if len(time) > 1 else 0.
+    stats.method = "binary"
+    stats.widths = None
+    if not stats.samples:
+        signal = np.array([], dtype=dtype)
+    return time, signal
+
+
+def _parse_mapped(file_address, columns, dtype, stats, block_size=MMAP_BLOCK_SIZE):
+    """
+    Memory-mapped parser: count the lines to preallocate the output, then
+    decode whole lines block_size bytes at a time straight into it
+    """
+    with open(file_address, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            stats.method = "mmap"
+            return np.array([]), np.array([], dtype=dtype)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            # Skip header lines
+            start = 0
+            for _ in range(2):
+                end = mapped.find(b"\n", start)
+                start = size if end < 0 else end + 1
+
+            # Upper bound of the sample count: one per line break, plus an unterminated last line
+            bytes_view = np.frombuffer(mapped, dtype=np.uint8)
+            lines = 0
+            for offset in range(start, size, block_size):
+                lines += int(np.count_nonzero(bytes_view[offset:offset + block_size] == ord("\n")))
+                _release(mapped, offset + block_size)
+            del bytes_view
+            lines += size > start and mapped[size - 1:size] != b"\n"
+
+            time = np.empty(lines)
+            signal = np.empty((lines, len(columns)), dtype=dtype)
+            stats.samples = 0
+            stats.max_delta = 0.
+            stats.method = "mmap"
+            offset = start
+            while offset < size:
+                # Blocks end on a line break; a line longer than a block makes a longer block
+                end = size
+                if offset + block_size < size:
+                    end = mapped.rfind(b"\n", offset, offset + block_size)
+                    if end < 0:
+                        end = mapped.find(b"\n", offset + block_size)
+                    end = size if end < 0 else end + 1
+                block = mapped[offset:end]
+                offset = end
+                _release(mapped, end)
+
+                samples = stats.samples
+                block_time, block_signal = _decode_block(block, columns, dtype, stats,
+                                                         time[samples - 1] if samples else None)
+                time[samples:stats.samples] = block_time
+                signal[samples:stats.samples] = block_signal
 
-    with open(file_address, 'rt') as f:
+    # Drop the rows reserved for empty lines, in place
+    time.resize(stats.samples, refcheck=False)
+    signal.resize((stats.samples, len(columns)), refcheck=False)
+    if not stats.samples:
+        signal = np.array([], dtype=dtype)
+    return time, signal
+
+
+def iter_wbb_file(file_address, block_size=65536, dtype=np.float64, channels=DEFAULT_CHANNELS, stats=None,
+                  read_size=MMAP_BLOCK_SIZE):
+    """
+    Parse a Nintendo Wii Board data file block by block, holding about one
+    block of samples and read_size bytes of text in memory at a time
+
+    How To use :
+        stats = ParseStats()
+        stream = SWARII(window_size, desired_frequency).stream()
+        for resampled_time, resampled_signal in stream.feed(iter_wbb_file(path, stats=stats)):
+            ...
+
+    Args:
+        file_address: Path to the file
+        block_size: Number of samples per block (the last block may be shorter)
+        dtype, channels: As in parse_wbb_file
+        stats: Optional ParseStats, updated after every block. Its max_delta
+               is the largest gap seen so far.
+        read_size: Number of bytes of text read at once
+
+    Yields:
+        Tuples of (time_array, signal_array), in file order. Concatenated,
+        they are the arrays parse_wbb_file returns.
+    """
+    columns = [CHANNEL_COLUMNS[channel] for channel in channels]
+    if stats is None:
+        stats = ParseStats()
+    stats.file_address = file_address
+    stats.samples = 0
+    stats.max_delta = 0.
+    stats.method = "stream"
+
+    if is_wbb_binary(file_address):
+        time, signal = _parse_binary(np.memmap(file_address, dtype=np.uint8, mode='r'), columns, dtype, stats)
+        for start in range(0, len(time), block_size):
+            yield time[start:start + block_size], signal[start:start + block_size]
+        return
+
+    pending_time = np.empty(0)
+    pending_signal = np.empty((0, len(columns)), dtype=dtype)
+    with open(file_address, 'rb') as f:
         # Skip header lines
         f.readline()
         f.readline()
 
-        maxDelta = 0.
-        for line in f:
-            if line.strip():  # Skip empty lines
-                data = line.split(" ")
-                t = 0.001 * float(data[0])  # Convert to seconds
-                x = float(data[5])
-                y = float(data[6])
-                time.append(t)
-                if len(time) > 1:
-                    maxDelta = max(maxDelta, time[-1] - time[-2])
-                signal.append([x, y])
-        print(f"MaxDelta in {file_address}: ", maxDelta)
-    return np.array(time), np.array(signal)
\ No newline at end of file
+        tail = b""
+        last_yielded = None
+        while True:
+            data = f.read(read_size)
+            # Decode whole lines only, the rest waits for the next read
+            text = tail + data
+            end = text.rfind(b"\n") + 1 if data else len(text)
+            text, tail = text[:end], text[end:]
+
+            last_time = pending_time[-1] if len(pending_time) else last_yielded
+            block_time, block_signal = _decode_block(text, columns, dtype, stats, last_time)
+            pending_time = np.concatenate((pending_time, block_time))
+            pending_signal = np.concatenate((pending_signal, block_signal))
+
+            while len(pending_time) >= block_size or (not data and len(pending_time)):
+                last_yielded = pending_time[min(block_size, len(pending_time)) - 1]
+                yield pending_time[:block_size], pending_signal[:block_size]
+                pending_time, pending_signal = pending_time[block_size:], pending_signal[block_size:]
+            if not data:
+                break
+
+
+def _decode_block(block, columns, dtype, stats, last_time=None):
+    """
+    Decode whole lines into (time, signal), with one signal row per sample,
+    and add them to stats. Lines the bulk reader rejects are read one by one.
+    last_time is the time stamp preceding the block.
+    """
+    if stats.widths is not None:
+        for width, lines in _line_widths(block).items():
+            stats.widths[width] = stats.widths.get(width, 0) + lines
+    parsed = _parse_body(block, columns, dtype)
+    if parsed is None:
+        block_time, block_signal = _parse_lines(block.decode().splitlines(), columns, dtype)
+        stats.method = "loop"
+    else:
+        block_time, block_signal, width = parsed
+        if stats.columns is None:
+            stats.columns = width
+
+    if len(block_time):
+        if last_time is not None:
+            stats.max_delta = max(stats.max_delta, float(block_time[0] - last_time))
+        if len(block_time) > 1:
+            stats.max_delta = max(stats.max_delta, float(np.diff(block_time).max()))
+        stats.samples += len(block_time)
+    return block_time, block_signal.reshape(len(block_time), len(columns))
+
+
+def _line_widths(block):
+    """
+    Number of values on the whole lines of a block, without decoding them
+
+    Returns:
+        Dict values per line -> number of lines (empty lines left out)
+    """
+    buffer = np.frombuffer(block, dtype=np.uint8)
+    if not len(buffer):
+        return {}
+    newlines = np.flatnonzero(buffer == ord("\n"))
+
+    # A value starts at every non-blank byte following a blank one
+    blank = buffer <= ord(" ")
+    starts = np.flatnonzero(blank[:-1] > blank[1:]) + 1
+    if not blank[0]:
+        starts = np.concatenate(([0], starts))
+    per_line = np.diff(np.concatenate(([0], np.searchsorted(starts, newlines), [len(starts)])))
+    widths, lines = np.unique(per_line[per_line > 0], return_counts=True)
+    return {int(width): int(count) for width, count in zip(widths, lines)}
+
+
+def _release(mapped, end):
+    """Drop the mapped pages before end from the resident set (they stay in the page cache)"""
+    end -= end % mmap.PAGESIZE
+    if end and hasattr(mapped, "madvise"):
+        mapped.madvise(mmap.MADV_DONTNEED, 0, end)
+
+
+def _parse_body(body, columns, dtype):
+    """
+    Decode a whole block of lines at once with NumPy's C text reader
+
+    Returns:
+        (time, signal, values_per_line), or None when a line cannot be read
+    """
+    first_line = re.search(rb"\S[^\n]*", body)
+    if first_line is None:
+        return np.array([]), np.array([], dtype=dtype), None
+    try:
+        values = np.loadtxt(io.BytesIO(body), usecols=[0] + columns, comments=None, ndmin=2)
+    except ValueError:
+        return None
+
+    time = 0.001 * values[:, 0]  # Convert to seconds
+    signal = values[:, 1:].astype(dtype)
+    return time, signal, len(first_line.group().split())
+
+
+def _parse_lines(lines, columns, dtype):
+    """Per-line parser, used for files the vectorized parser cannot handle"""
+    time = []
+    signal = []
+    for line in lines:
+        if line.strip():  # Skip empty lines
+            data = line.split(" ")
+            time.append(0.001 * float(data[0]))  # Convert to seconds
+            signal.append([float(data[column]) for column in columns])
+    return np.array(time), np.array(signal, dtype=dtype)
@@ -1,11 +1,11 @@
 import os
-import numpy as np
-import pandas as pd
 from datetime import datetime
 from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
 
-from adapted.descriptors import compute_all_features
-from adapted.stabilogram.stato import Stabilogram
+from core.feature_processor import FeatureProcessor
+from core.image_processor import ImageProcessor
+from core.output_stages import OutputStages
+from utils.output_reader import iter_outputs
 
 
 class FileProcessorWorker(QObject):
@@ -33,24 +33,93 @@ class FileProcessorWorker(QObject):
                 self.x,
                 self.y,
                 max_depth=self.config.max_depth,
-                log_callback=self.log_callback
+                log_callback=self.log_callback,
+                manifest=self._manifest() if self.config.use_manifest else None
             )
         except Exception as e:
             self.log_callback(f"Error during processing: {str(e)}", color="red")
         finally:
             self.finished_signal.emit()
 
+    @pyqtSlot()
+    def process_fused(self):
+        """
+        Process all files in the input directory, rendering the image and computing the features of
+        every output from its arrays in memory, in the same pass
+        """
+        try:
+            images_dir = os.path.join(self.output_dir, "_images")
+            os.makedirs(images_dir, exist_ok=True)
+            stages = OutputStages(ImageProcessor(self.config), FeatureProcessor(self.config), images_dir)
+            self.processor.process_files(
+                self.input_dir,
+                self.output_dir,
+                self.cut_option,
+                self.x,
+                self.y,
+                max_depth=self.config.max_depth,
+                log_callback=self.log_callback,
+                manifest=self._manifest() if self.config.use_manifest else None,
+                on_output=stages
+            )
+
+            result_csv_path = self._summary_path()
+            with open(result_csv_path, 'w') as result_file:
+                result_file.write(f"{self.config.get('csv_file_header')}\n")
+                for result_row in self.processor.output_results:
+                    if result_row is not None:
+                        result_file.write(f"{result_row}\n")
+            self.log_callback(f"Feature extraction completed. Results saved to {result_csv_path}", color="green")
+        except Exception as e:
+            self.log_callback(f"Error during processing: {str(e)}", color="red")
+        finally:
+            self.finished_signal.emit()
+
+    @pyqtSlot()
+    def scan(self):
+        """Write the manifest of the recordings in the input directory"""
+        try:
+            self.processor.scan_inputs(
+                self.input_dir,
+                os.path.join(self.output_dir, "manifest.json"),
+                max_depth=self.config.max_depth,
+                log_callback=self.log_callback
+            )
+        except Exception as e:
+            self.log_callback(f"Error during scan: {str(e)}", color="red")
+        finally:
+            self.finished_signal.emit()
+
+    def _manifest(self):
+        """Manifest of the output directory, if the inputs were scanned"""
+        manifest = os.path.join(self.output_dir, "manifest.json")
+        return manifest if os.path.exists(manifest) else None
+
+    @pyqtSlot()
+    def process_sweep(self):
+        """Resample all files in the input directory under every sweep parameter pair"""
+        try:
+            self.processor.process_sweep(
+                self.input_dir,
+                self.output_dir,
+                self.cut_option,
+                self.x,
+                self.y,
+                self.config.sweep_parameters,
+                max_depth=self.config.max_depth,
+                log_callback=self.log_callback
+            )
+        except Exception as e:
+            self.log_callback(f"Error during parameter sweep: {str(e)}", color="red")
+        finally:
+            self.finished_signal.emit()
+
     @pyqtSlot()
     def process_csv(self):
         """Generate summary CSV file from processed data files"""
         try:
-            # Create the _csv directory if it doesn't exist
-            csv_dir = os.path.join(self.output_dir, "_csv")
-            os.makedirs(csv_dir, exist_ok=True)
-
-            # Create the results CSV file with timestamp in name
-            timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M')
-            result_csv_path = os.path.join(csv_dir, f"{timestamp}.csv")
+            feature_processor = FeatureProcessor(self.config)
+            result_csv_path = self._summary_path()
 
             # Create header row for the CSV
             header = self.config.get("csv_file_header")
@@ -61,33 +130,20 @@ class FileProcessorWorker(QObject):
             with open(result_csv_path, 'w') as result_file:
                 result_file.write(f"{header}\n")
 
-                # Process each CSV file
-                for root, _, files in os.walk(self.output_dir):
-                    for file in files:
-                        if file.endswith(".csv") and "_csv" not in root and "_images" not in root:
-                            file_path = os.path.join(root, file)
-                            self.log_callback(f"Computing features for {file_path}", color="blue")
-
-                            try:
-                                df = pd.read_csv(str(file_path), sep=r'\s+', skiprows=1,
-                                                 names=['Time', 'X', 'Y'])
-                                stato = Stabilogram()
-                                stato.from_array(array=np.array([df['X'], df['Y']]).T,
-                                                 original_frequency=self.config.get("desired_frequency"), resample=False)
-                                sway_density_radius = 0.3  # 3 mm
-                                params_dic = {"sway_density_radius": sway_density_radius}
-                                features = compute_all_features(stato, params_dic=params_dic)
-
-                                # Write a row with the filename and features
-                                result_row = f"{file}"
-                                for feature_name in features:
-                                    result_row += f",{features[feature_name]}"
-
-                                result_file.write(f"{result_row}\n")
-                                self.log_callback(f"Features added for {file}", color="green")
-
-                            except Exception as e:
-                                self.log_callback(f"Error processing file {file}: {str(e)}", color="red")
+                # Process each output file, or recording of the store
+                for file_path, load in iter_outputs(self.output_dir):
+                    file = os.path.basename(file_path)
+                    self.log_callback(f"Computing features for {file_path}", color="blue")
+
+                    try:
+                        features = feature_processor.compute_features(load()[:, 1:3])
+
+                        # Write a row with the filename and features
+                        result_file.write(f"{feature_processor.feature_row(file, features)}\n")
+                        self.log_callback(f"Features added for {file}", color="green")
+
+                    except Exception as e:
+                        self.log_callback(f"Error processing file {file}: {str(e)}", color="red")
 
             self.log_callback(f"Feature extraction completed. Results saved to {result_csv_path}", color="green")
         except Exception as e:
@@ -95,6 +151,16 @@ class FileProcessorWorker(QObject):
         finally:
             self.finished_signal.emit()
 
+    def _summary_path(self):
+        """Path of a new summary CSV file, named after the current time, in the _csv directory"""
+        # Create the _csv directory if it doesn't exist
+        csv_dir = os.path.join(self.output_dir, "_csv")
+        os.makedirs(csv_dir, exist_ok=True)
+
+        # Create the results CSV file with timestamp in name
+        timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M')
+        return os.path.join(csv_dir, f"{timestamp}.csv")
+
     def log_callback(self, message, color="black"):
         """Emit log message signal to update the UI log"""
         self.log_signal.emit(message, color)
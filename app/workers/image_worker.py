@@ -1,6 +1,8 @@
 import os
 from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
 
+from utils.output_reader import iter_outputs
+
 
 class ImageProcessorWorker(QObject):
     log_signal = pyqtSignal(str, str)
@@ -20,19 +22,17 @@ class ImageProcessorWorker(QObject):
             images_dir = os.path.join(self.output_dir, "_images")
             os.makedirs(images_dir, exist_ok=True)
 
-            # Process each CSV file
-            for root, _, files in os.walk(self.output_dir):
-                for file in files:
-                    if file.endswith(".csv") and "_csv" not in root and "_images" not in root:
-                        file_path = os.path.join(root, file)
-                        output_path = os.path.join(images_dir, os.path.basename(file_path).replace(".csv", ".jpg"))
-                        self.log_callback(f"Generating image for {file_path}", color="blue")
-
-                        try:
-                            output_path = self.processor.generate_image(file_path, output_path)
-                            self.log_callback(f"Image saved to {output_path}", color="green")
-                        except Exception as e:
-                            self.log_callback(f"Error generating image for {file_path}: {str(e)}", color="red")
+            # Process each output file, or recording of the store
+            for file_path, load in iter_outputs(self.output_dir):
+                output_path = self.processor.image_path(images_dir, file_path)
+                self.log_callback(f"Generating image for {file_path}", color="blue")
+
+                try:
+                    data = load()
+                    output_path = self.processor.render_image(data[:, 0], data[:, 1], data[:, 2], output_path)
+                    self.log_callback(f"Image saved to {output_path}", color="green")
+                except Exception as e:
+                    self.log_callback(f"Error generating image for {file_path}: {str(e)}", color="red")
         except Exception as e:
             self.log_callback(f"Error during image generation: {str(e)}", color="red")
         finally: